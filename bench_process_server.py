@@ -0,0 +1,360 @@
+"""Benchmark the face measurement service.
+
+Builds a local corpus from one or more seed face photos: every seed at several
+resolutions and JPEG qualities, plus generated no-face images and corrupt
+files. The corpus is then driven through the service at each concurrency
+level, and throughput, latency percentiles, peak RSS and the per-stage
+breakdown from /metrics are written as JSON. Runs fully offline on CPU.
+
+    python bench_process_server.py --seed-dir faces/ --out results.json
+    python bench_process_server.py --seed-dir faces/ --mode http --url http://127.0.0.1:6006/
+    python bench_process_server.py --seed-dir faces/ --out new.json --compare results.json
+
+Modes: "inprocess" posts to /process through Flask's test client, "pipeline"
+calls decode_image/measure_image directly, and "http" posts to a running server.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+RESOLUTIONS = (640, 1280, 2560, 4000)
+JPEG_QUALITIES = (60, 85, 95)
+SEED_EXTENSIONS = (".jpg", ".jpeg", ".jfif", ".png", ".webp")
+
+
+def build_corpus(seed_paths, corpus_dir, resolutions=RESOLUTIONS, qualities=JPEG_QUALITIES):
+    import cv2
+
+    os.makedirs(corpus_dir, exist_ok=True)
+    cases = []
+
+    def add(name, group, data):
+        path = os.path.join(corpus_dir, name)
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(data)
+        cases.append({"name": name, "group": group, "path": path})
+
+    for seed_index, seed_path in enumerate(seed_paths):
+        seed = cv2.imread(seed_path, cv2.IMREAD_COLOR)
+        if seed is None:
+            print(f"Skipping unreadable seed image: {seed_path}")
+            continue
+        h, w = seed.shape[:2]
+        for side in resolutions:
+            scale = side / max(h, w)
+            resized = cv2.resize(seed, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+            for quality in qualities:
+                ok, encoded = cv2.imencode(".jpg", resized, [cv2.IMWRITE_JPEG_QUALITY, quality])
+                if ok:
+                    add(f"face{seed_index}_{side}_q{quality}.jpg", f"face_{side}", encoded.tobytes())
+
+    # Fixed seeds keep the generated cases identical between runs
+    rng = np.random.default_rng(0)
+    gradient = np.linspace(0, 255, 1280, dtype=np.float32)[None, :, None].repeat(960, 0).repeat(3, 2)
+    noise = np.clip(gradient + rng.normal(0, 25, gradient.shape), 0, 255).astype(np.uint8)
+    ok, encoded = cv2.imencode(".jpg", noise, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    add("noface_1280.jpg", "no_face", encoded.tobytes())
+    ok, encoded = cv2.imencode(".png", np.full((720, 720, 3), 128, np.uint8))
+    add("noface_flat.png", "no_face", encoded.tobytes())
+
+    full_jpeg = encoded.tobytes()
+    if cases and cases[0]["group"].startswith("face_"):
+        with open(cases[0]["path"], "rb") as f:
+            full_jpeg = f.read()
+    add("corrupt_truncated.jpg", "corrupt", full_jpeg[: len(full_jpeg) // 2])
+    add("corrupt_random.jpg", "corrupt", rng.integers(0, 256, 64 * 1024, dtype=np.uint8).tobytes())
+    add("corrupt_header_only.jpg", "corrupt", b"\xff\xd8\xff\xe0" + b"\x00" * 16)
+    return cases
+
+
+def encode_multipart(field, filename, data):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"{field}\"; filename=\"{filename}\"\r\n"
+        f"Content-Type: application/octet-stream\r\n\r\n"
+    ).encode() + data + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+class Target:
+    """Sends one image and returns the status code; also scrapes /metrics."""
+
+    def __init__(self, mode, url=None, server_pid=None):
+        self.mode = mode
+        self.url = url
+        self.server_pid = server_pid
+        self._local = threading.local()
+        if mode != "http":
+            import process_server
+
+            self.server = process_server
+
+    def send(self, name, data):
+        if self.mode == "http":
+            body, content_type = encode_multipart("image", name, data)
+            req = urllib.request.Request(self.url + "process", data=body, headers={"Content-Type": content_type})
+            try:
+                with urllib.request.urlopen(req, timeout=60) as response:
+                    response.read()
+                    return response.status
+            except urllib.error.HTTPError as e:
+                return e.code
+        if self.mode == "inprocess":
+            client = getattr(self._local, "client", None)
+            if client is None:
+                client = self._local.client = self.server.app.test_client()
+            body, content_type = encode_multipart("image", name, data)
+            return client.post("/process", data=body, content_type=content_type).status_code
+
+        ps = self.server
+        try:
+            image, original_size = ps.decode_image(data, ps.decode_max_side())
+            with ps.get_face_mesh_pool().checkout() as face_mesh:
+                ps.format_measurements(ps.measure_image(image, face_mesh, original_size))
+            return 200
+        except ps.MeasurementError as e:
+            return e.status
+
+    def metrics_text(self):
+        if self.mode == "http":
+            with urllib.request.urlopen(self.url + "metrics", timeout=10) as response:
+                return response.read().decode()
+        return self.server.metrics.render()
+
+    def peak_rss_mb(self):
+        # The service's peak RSS: this process unless the service runs elsewhere
+        if self.mode != "http":
+            return peak_rss_mb()
+        return server_peak_rss_mb(self.server_pid) if self.server_pid else None
+
+
+def stage_totals(metrics_text):
+    # {stage: [sum_seconds, count]} from measure_stage_seconds
+    totals = {}
+    for line in metrics_text.splitlines():
+        for suffix, slot in (("_sum", 0), ("_count", 1)):
+            prefix = f"measure_stage_seconds{suffix}{{stage=\""
+            if line.startswith(prefix):
+                stage = line[len(prefix) : line.index('"', len(prefix))]
+                totals.setdefault(stage, [0.0, 0])[slot] = float(line.rsplit(" ", 1)[1])
+    return totals
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(own, children) / 1024, 1)
+
+
+def server_peak_rss_mb(pid):
+    """Largest VmHWM of pid and its descendants (e.g. a gunicorn master and its workers), or None."""
+    peak, pending = None, [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        # Reported in kB
+                        value = int(line.split()[1]) / 1024
+                        peak = value if peak is None else max(peak, value)
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return None if peak is None else round(peak, 1)
+
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)), 3) if values else None
+
+
+def run_level(target, cases, concurrency, repeat):
+    payloads = []
+    for case in cases:
+        with open(case["path"], "rb") as f:
+            payloads.append((case, f.read()))
+    work = payloads * repeat
+
+    before = stage_totals(target.metrics_text())
+    latencies = {}
+    statuses = {}
+    lock = threading.Lock()
+
+    def one(item):
+        case, data = item
+        started = time.perf_counter()
+        status = target.send(case["name"], data)
+        elapsed = (time.perf_counter() - started) * 1000
+        with lock:
+            latencies.setdefault(case["group"], []).append(elapsed)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, work))
+    wall = time.perf_counter() - started
+
+    after = stage_totals(target.metrics_text())
+    stages = {}
+    for stage, (total, count) in after.items():
+        prev_total, prev_count = before.get(stage, (0.0, 0))
+        if count > prev_count:
+            stages[stage] = {
+                "mean_ms": round((total - prev_total) / (count - prev_count) * 1000, 3),
+                "count": int(count - prev_count),
+            }
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        "concurrency": concurrency,
+        "requests": len(work),
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(work) / wall, 2) if wall else None,
+        "latency_ms": {
+            "p50": percentile(all_latencies, 50),
+            "p95": percentile(all_latencies, 95),
+            "p99": percentile(all_latencies, 99),
+            "mean": round(float(np.mean(all_latencies)), 3),
+        },
+        "groups": {
+            group: {"p50": percentile(values, 50), "p95": percentile(values, 95), "n": len(values)}
+            for group, values in sorted(latencies.items())
+        },
+        "statuses": statuses,
+        "stages": stages,
+        "peak_rss_mb": target.peak_rss_mb(),
+    }
+
+
+def environment():
+    info = {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()}
+    for module in ("cv2", "mediapipe", "numpy"):
+        try:
+            info[module] = __import__(module).__version__
+        except Exception:
+            info[module] = None
+    try:
+        info["git_commit"] = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), text=True
+        ).strip()
+    except Exception:
+        info["git_commit"] = None
+    return info
+
+
+def compare(current, baseline, tolerance):
+    """Print per-level deltas against a previous result file; return the number of regressions."""
+    previous = {run["concurrency"]: run for run in baseline["runs"]}
+    regressions = 0
+    print(f"\nComparison against {baseline['environment'].get('git_commit')} (tolerance {tolerance:.0%})")
+    if baseline["config"]["mode"] != current["config"]["mode"]:
+        print(f"  Note: baseline mode {baseline['config']['mode']!r} differs from {current['config']['mode']!r}")
+    for run in current["runs"]:
+        old = previous.get(run["concurrency"])
+        if old is None:
+            continue
+        for label, new_value, old_value, higher_is_better in (
+            ("throughput_rps", run["throughput_rps"], old["throughput_rps"], True),
+            ("p50_ms", run["latency_ms"]["p50"], old["latency_ms"]["p50"], False),
+            ("p95_ms", run["latency_ms"]["p95"], old["latency_ms"]["p95"], False),
+            ("p99_ms", run["latency_ms"]["p99"], old["latency_ms"]["p99"], False),
+        ):
+            if not old_value or new_value is None:
+                continue
+            change = (new_value - old_value) / old_value
+            worse = -change if higher_is_better else change
+            flag = "REGRESSION" if worse > tolerance else ""
+            regressions += bool(flag)
+            print(f"  c={run['concurrency']:<3} {label:<15} {old_value:>10} -> {new_value:>10} ({change:+.1%}) {flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seed-dir", required=True, help="Directory of face photos used to build the corpus")
+    parser.add_argument("--corpus-dir", default="bench_corpus")
+    parser.add_argument("--mode", choices=("inprocess", "pipeline", "http"), default="inprocess")
+    parser.add_argument("--url", default="http://127.0.0.1:6006/", help="Service base URL for --mode http")
+    parser.add_argument(
+        "--server-pid", type=int, help="Service PID for peak RSS in --mode http (read from /proc, else recorded as null)"
+    )
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the corpus per concurrency level")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed passes over the corpus before measuring")
+    parser.add_argument("--with-cache", action="store_true", help="Leave the result cache on (off by default)")
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--compare", help="Previous result file to diff against")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args()
+
+    if not args.with_cache:
+        # Repeated corpus passes would otherwise measure cache hits; must be set before import
+        os.environ["RESULT_CACHE_ENTRIES"] = "0"
+        os.environ.pop("RESULT_CACHE_DB", None)
+    if args.mode != "http":
+        # Allow every benchmark thread in without admission rejections
+        os.environ.setdefault("ADMISSION_MAX_WAITING", str(max(args.concurrency)))
+
+    seeds = sorted(
+        os.path.join(args.seed_dir, name)
+        for name in os.listdir(args.seed_dir)
+        if name.lower().endswith(SEED_EXTENSIONS)
+    )
+    cases = build_corpus(seeds, args.corpus_dir)
+    print(f"Corpus: {len(cases)} files in {args.corpus_dir}")
+
+    target = Target(args.mode, args.url if args.url.endswith("/") else args.url + "/", args.server_pid)
+    for _ in range(args.warmup):
+        run_level(target, cases, 1, 1)
+
+    runs = []
+    for concurrency in args.concurrency:
+        run = run_level(target, cases, concurrency, args.repeat)
+        runs.append(run)
+        latency = run["latency_ms"]
+        print(
+            f"c={concurrency:<3} {run['throughput_rps']:>8} req/s  p50 {latency['p50']} ms  "
+            f"p95 {latency['p95']} ms  p99 {latency['p99']} ms  rss {run['peak_rss_mb']} MB  {run['statuses']}"
+        )
+        for stage, values in sorted(run["stages"].items(), key=lambda item: -item[1]["mean_ms"]):
+            print(f"        {stage:<12} {values['mean_ms']:>9.3f} ms  (n={values['count']})")
+
+    result = {
+        "environment": environment(),
+        "config": {
+            "mode": args.mode,
+            "repeat": args.repeat,
+            "with_cache": args.with_cache,
+            "cases": [case["name"] for case in cases],
+        },
+        "runs": runs,
+    }
+    with open(args.out, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"Results written to {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(result, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
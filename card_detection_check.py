@@ -0,0 +1,152 @@
+"""Check the reference-card detector on synthetic cards drawn onto real portraits.
+
+Every portrait gets flat, opaque, sharp-cornered ID-1 cards in several
+colours held against the forehead, the chin and each cheek, at a random size
+(from a jaw width of 125-155 mm), rotation and offset. Scenes are blurred
+slightly and JPEG-compressed like an upload; placements that would leave the
+card partly outside the frame are skipped. A card counts as found when
+detect_reference_card returns a width within --tolerance of the drawn one.
+The exit status is non-zero when the found rate drops below --min-rate, so
+the script can guard changes to the detector.
+
+    python card_detection_check.py path/to/portraits --seeds 2 --min-rate 0.8 --json cards.json
+"""
+import argparse
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from process_server import (
+    CARD_DETECTION_BUDGET_MS,
+    CREDIT_CARD_HEIGHT_MM,
+    CREDIT_CARD_WIDTH_MM,
+    FACE_MESH_OPTIONS,
+    MeasurementError,
+    decode_image,
+    detect_landmarks,
+    detect_reference_card,
+    mediapipe_solutions,
+)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".jfif", ".png", ".webp")
+# BGR fills: white plastic, saturated dark red, silver, black, dark blue
+CARD_COLORS = {
+    "light": (230, 225, 220),
+    "dark_red": (40, 60, 150),
+    "grey": (200, 200, 205),
+    "black": (30, 30, 30),
+    "blue": (120, 60, 20),
+}
+PLACEMENTS = ("forehead", "chin", "left_cheek", "right_cheek")
+FOREHEAD, CHIN, NOSE_TIP, RIGHT_CHEEK, LEFT_CHEEK = 10, 152, 1, 234, 454
+
+
+def card_center(placement, points, card_w, card_h):
+    """Card centre in pixels for a placement, overlapping the face as when held against it."""
+    if placement == "forehead":
+        return points[FOREHEAD, 0], points[FOREHEAD, 1] + card_h * 0.25
+    if placement == "chin":
+        return points[CHIN, 0], points[CHIN, 1] + card_h * 0.6
+    # Image-left cheek is the subject's right (landmark 234)
+    if placement == "left_cheek":
+        return points[RIGHT_CHEEK, 0] - card_w * 0.3, points[NOSE_TIP, 1]
+    return points[LEFT_CHEEK, 0] + card_w * 0.3, points[NOSE_TIP, 1]
+
+
+def scenes(image, points, rng):
+    """(placement, colour, drawn card width in px, encoded scene) for one portrait."""
+    h, w = image.shape[:2]
+    jaw = np.linalg.norm(points[LEFT_CHEEK, :2] - points[RIGHT_CHEEK, :2])
+    for placement in PLACEMENTS:
+        for color_name, color in CARD_COLORS.items():
+            pixels_per_mm = jaw / rng.uniform(125, 155)
+            card_w, card_h = CREDIT_CARD_WIDTH_MM * pixels_per_mm, CREDIT_CARD_HEIGHT_MM * pixels_per_mm
+            cx, cy = card_center(placement, points, card_w, card_h)
+            cx, cy = cx + rng.uniform(-0.1, 0.1) * card_w, cy + rng.uniform(-0.1, 0.1) * card_h
+            corners = cv2.boxPoints(((cx, cy), (card_w, card_h), rng.uniform(-15, 15)))
+            if corners.min() < 2 or corners[:, 0].max() > w - 3 or corners[:, 1].max() > h - 3:
+                yield placement, color_name, card_w, None
+                continue
+            scene = image.copy()
+            cv2.fillPoly(scene, [np.rint(corners * 16).astype(np.int32)], color, cv2.LINE_AA, 4)
+            scene = cv2.GaussianBlur(scene, (0, 0), rng.uniform(0.6, 1.2))
+            ok, encoded = cv2.imencode(".jpg", scene, [cv2.IMWRITE_JPEG_QUALITY, 90])
+            yield placement, color_name, card_w, encoded.tobytes()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("images", help="Directory of portrait photos")
+    parser.add_argument("--seeds", type=int, default=2, help="Random size/rotation/offset draws per portrait")
+    parser.add_argument("--tolerance", type=float, default=0.03, help="Largest relative width error that counts as found")
+    parser.add_argument("--min-rate", type=float, default=0.8, help="Exit non-zero below this found rate")
+    parser.add_argument("--budget-ms", type=float, default=CARD_DETECTION_BUDGET_MS)
+    parser.add_argument("--json", help="Write the per-scene results to this file")
+    args = parser.parse_args()
+
+    paths = sorted(
+        os.path.join(args.images, name)
+        for name in os.listdir(args.images)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    results = []
+    with mediapipe_solutions().face_mesh.FaceMesh(**FACE_MESH_OPTIONS) as face_mesh:
+        for path in paths:
+            with open(path, "rb") as f:
+                portrait, (w, h) = decode_image(f.read())
+            # Mirrored copies put the other side of the face and hair against each cheek card
+            for mirrored, image in ((False, portrait), (True, cv2.flip(portrait, 1))):
+                try:
+                    points = detect_landmarks(image, face_mesh, roi_refine=False)
+                except MeasurementError as e:
+                    print(f"Skipping {path}: {e}")
+                    break
+                for seed in range(args.seeds):
+                    rng = np.random.default_rng(seed)
+                    for placement, color, card_w, data in scenes(image, points * [w, h, w], rng):
+                        result = {"image": path, "mirrored": mirrored, "seed": seed, "placement": placement, "color": color}
+                        if data is None:
+                            results.append(dict(result, status="skipped"))
+                            continue
+                        scene, _ = decode_image(data)
+                        started = time.perf_counter()
+                        card = detect_reference_card(scene, points, args.budget_ms)
+                        elapsed = (time.perf_counter() - started) * 1000
+                        error = None if card is None else (card["width_px"] - card_w) / card_w
+                        found = error is not None and abs(error) <= args.tolerance
+                        results.append(
+                            dict(result, status="found" if found else "missed", error=error, elapsed_ms=elapsed)
+                        )
+
+    checked = [r for r in results if r["status"] != "skipped"]
+    if not checked:
+        parser.error("no usable scenes")
+    print(f"{'':<12} " + " ".join(f"{color:>9}" for color in CARD_COLORS))
+    for placement in PLACEMENTS:
+        cells = []
+        for color in CARD_COLORS:
+            group = [r for r in checked if r["placement"] == placement and r["color"] == color]
+            found = sum(r["status"] == "found" for r in group)
+            cells.append(f"{found:>4}/{len(group):<4}" if group else f"{'-':>9}")
+        print(f"{placement:<12} " + " ".join(cells))
+
+    found = [r for r in checked if r["status"] == "found"]
+    rate = len(found) / len(checked)
+    errors = np.abs([r["error"] for r in found]) if found else np.array([np.nan])
+    times = [r["elapsed_ms"] for r in checked]
+    print(
+        f"Found {len(found)}/{len(checked)} ({rate:.0%}), {len(results) - len(checked)} skipped; "
+        f"width error mean {np.mean(errors):.2%}, max {np.max(errors):.2%}; "
+        f"time median {np.median(times):.1f} ms, max {np.max(times):.1f} ms"
+    )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"found_rate": rate, "scenes": results}, f, indent=2)
+    raise SystemExit(0 if rate >= args.min_rate else 1)
+
+
+if __name__ == "__main__":
+    main()
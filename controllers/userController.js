@@ -17,10 +17,9 @@ import { Order, ShippingAddress } from "../models/Order.js";
 import { Policy, FAQ } from "../models/PolicyModel.js";
 import { Appointment, Center } from "../models/Appointment.js";
 import Notification from "../models/NotificationModel.js";
-import axios from "axios";
 import fs from "fs";
-import FormData from "form-data";
 import FaceMeasurement from "../models/FaceMeasurement.js";
+import { measureServiceRequest } from "../utils/measureService.js";
 
 const generateJwtToken = (user) => {
   return jwt.sign(
@@ -1414,17 +1413,21 @@ export const getUserNotifications = async (req, res) => {
 export const measure = async (req, res) => {
   try {
     const tempPath = req.file ? req.file.path : "";
-    const formData = new FormData();
-    formData.append("image", fs.createReadStream(tempPath));
     try {
-      const response = await axios.post(
-        `${process.env.MEASURE_URL}process`,
-        formData,
-        {
-          headers: formData.getHeaders(),
-          timeout: 10000,
-        }
-      );
+      // The saved upload is streamed as the raw request body, no multipart re-encoding
+      const response = await measureServiceRequest("process", {
+        method: "post",
+        data: fs.createReadStream(tempPath),
+        headers: {
+          "Content-Type": "application/octet-stream",
+          "Content-Length": req.file ? req.file.size : 0,
+          "X-Filename": req.file ? req.file.originalname : "",
+          // Lets the Python service skip work once this request has timed out
+          "X-Request-Timeout-Ms": "10000",
+        },
+        maxBodyLength: Infinity,
+        timeout: 10000,
+      });
       const data = response.data;
 
       const image = req.file ? req.file.path.split(path.sep).join("/") : "";
@@ -1438,6 +1441,11 @@ export const measure = async (req, res) => {
         },
       });
     } catch (error) {
+      // Rejected photos (blurry, dark, no face...) come back as 422 with a reason the app can show
+      if (error.response && error.response.status === 422) {
+        const { error: message, reason, "Image Quality": quality } = error.response.data;
+        return res.status(422).json({ success: false, message, reason, quality });
+      }
       console.error("Error communicating with Python server:", error.message);
       res.status(500).json({ error: "Failed to process image" });
     }
@@ -5,6 +5,7 @@ import {
   TumblingETest,
   VisualAcuity,
 } from "../models/EyeTest.js";
+import { measureServiceRequest } from "../utils/measureService.js";
 const BASE_URL = "http://localhost:6005";
 
 const getQuestionForSize = (step) => {
@@ -503,51 +504,80 @@ export const getContrastResults = async (req, res) => {
   }
 };
 
+// plateUrl serves the plate pre-rasterized by the measurement service;
+// append ?width=...&format=webp|png
 const colorTestQuestions = [
   {
     imageName: "ishihara_1",
     imageUrl: `/ColorTestImages/ishihara_1.svg`,
+    plateUrl: `/ColorTestPlates/ishihara_1`,
     options: ["12", "46", "48", "42", "Nothing"],
     correctOption: "12",
   },
   {
     imageName: "ishihara_2",
     imageUrl: `/ColorTestImages/ishihara_2.svg`,
+    plateUrl: `/ColorTestPlates/ishihara_2`,
     options: ["29", "89", "28", "21", "Nothing"],
     correctOption: "29",
   },
   {
     imageName: "ishihara_3",
     imageUrl: `/ColorTestImages/ishihara_3.svg`,
+    plateUrl: `/ColorTestPlates/ishihara_3`,
     options: ["74", "14", "71", "76", "Nothing"],
     correctOption: "74",
   },
   {
     imageName: "ishihara_4",
     imageUrl: `/ColorTestImages/ishihara_4.svg`,
+    plateUrl: `/ColorTestPlates/ishihara_4`,
     options: ["45", "15", "46", "48", "Nothing"],
     correctOption: "45",
   },
   {
     imageName: "ishihara_5",
     imageUrl: `/ColorTestImages/ishihara_5.svg`,
+    plateUrl: `/ColorTestPlates/ishihara_5`,
     options: ["5", "6", "8", "9", "Nothing"],
     correctOption: "5",
   },
   {
     imageName: "ishihara_6",
     imageUrl: `/ColorTestImages/ishihara_6.svg`,
+    plateUrl: `/ColorTestPlates/ishihara_6`,
     options: ["14", "36", "47", "32", "Nothing"],
     correctOption: "Nothing",
   },
   {
     imageName: "ishihara_7",
     imageUrl: `/ColorTestImages/ishihara_7.svg`,
+    plateUrl: `/ColorTestPlates/ishihara_7`,
     options: ["8", "9", "6", "2", "Nothing"],
     correctOption: "8",
   },
 ];
 
+export const getColorPlate = async (req, res) => {
+  try {
+    const ifNoneMatch = req.headers["if-none-match"];
+    const response = await measureServiceRequest(`plates/${encodeURIComponent(req.params.name)}`, {
+      params: { width: req.query.width, format: req.query.format },
+      headers: ifNoneMatch ? { "If-None-Match": ifNoneMatch } : {},
+      responseType: "stream",
+      validateStatus: (status) => status < 500,
+      timeout: 10000,
+    });
+    res.status(response.status);
+    for (const header of ["content-type", "content-length", "etag", "cache-control"]) {
+      if (response.headers[header]) res.set(header, response.headers[header]);
+    }
+    response.data.pipe(res);
+  } catch (error) {
+    res.status(502).json({ success: false, message: "Plate service unavailable" });
+  }
+};
+
 export const startColorTest = async (req, res) => {
   try {
     const userId = req.user.id;
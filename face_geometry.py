@@ -0,0 +1,168 @@
+"""Face measurement geometry on plain landmark arrays.
+
+Only numpy is needed here, so the same code serves the Flask service, bulk
+re-processing and benchmarks without loading MediaPipe.
+"""
+import numpy as np
+
+NUM_LANDMARKS = 478
+
+# FaceMesh landmark indices used by the measurements
+LEFT_PUPIL = 468
+RIGHT_PUPIL = 473
+NOSE_TIP = 1
+TOP_OF_FACE = 10
+CHIN_BOTTOM = 152
+JAW_LEFT, JAW_RIGHT = 454, 234
+CHEEKBONE_LEFT, CHEEKBONE_RIGHT = 323, 93
+FOREHEAD_LEFT, FOREHEAD_RIGHT = 301, 71
+
+# Average adult jaw width used as the scale when no reference object is available
+ASSUMED_JAW_WIDTH_MM = 140.0
+
+SCALE_FROM_CARD = "reference_card"
+SCALE_FROM_JAW = "assumed_jaw_width"
+
+# Compact landmark export: uint16 maps this normalized range onto 0..65535
+# (about 0.1 px at 4000 px; FaceMesh points can fall slightly outside the
+# frame), float16 stores the values as-is with ~11 bits of mantissa
+LANDMARK_ENCODINGS = ("uint16", "float16")
+UINT16_RANGE = (-0.25, 1.25)
+
+# Classification thresholds
+TIGHT_SIMILARITY = 0.10
+MODERATE_SIMILARITY = 0.15
+SIGNIFICANT_DIFFERENCE = 0.25
+
+FACE_SHAPES = ("Square", "Diamond", "Heart", "Triangle", "Round", "Rectangle")
+DEFAULT_FACE_SHAPE = "Oval"
+
+
+def classify_face_shapes(
+    length,
+    cheekbone,
+    jaw,
+    forehead,
+    tight=TIGHT_SIMILARITY,
+    moderate=MODERATE_SIMILARITY,
+    significant=SIGNIFICANT_DIFFERENCE,
+):
+    """Face shape per face from the four mm measurements (arrays of shape (N,))."""
+    epsilon = 1e-6  # Prevent division by zero
+    length, cheekbone, jaw, forehead = (np.asarray(v) + epsilon for v in (length, cheekbone, jaw, forehead))
+
+    length_to_width = length / cheekbone
+    jaw_to_cheekbone = jaw / cheekbone
+    forehead_to_cheekbone = forehead / cheekbone
+    forehead_to_jaw = forehead / jaw
+
+    # Conditions are checked in order, first match wins, matching the original if/elif chain
+    conditions = [
+        (np.abs(length_to_width - 1) <= 0.2)
+        & (np.abs(forehead_to_cheekbone - 1) <= tight)
+        & (np.abs(jaw_to_cheekbone - 1) <= tight),
+        (jaw_to_cheekbone < 1 - significant)
+        & (forehead_to_cheekbone < 1 - significant)
+        & (length_to_width > 1 + moderate),
+        (forehead_to_cheekbone > 1 + moderate) & (forehead_to_jaw > 1 + significant),
+        (jaw_to_cheekbone > 1 + moderate) & (forehead_to_jaw < 1 - significant),
+        (np.abs(length_to_width - 1) <= moderate)
+        & (np.abs(forehead_to_cheekbone - 1) <= moderate)
+        & (np.abs(jaw_to_cheekbone - 1) <= moderate),
+        (length_to_width > 1 + significant)
+        & (np.abs(forehead_to_cheekbone - 1) <= moderate)
+        & (np.abs(jaw_to_cheekbone - 1) <= moderate),
+    ]
+    return np.select(conditions, FACE_SHAPES, default=DEFAULT_FACE_SHAPE)
+
+
+def measure_faces(
+    landmarks, image_sizes, jaw_width_mm=ASSUMED_JAW_WIDTH_MM, pixels_per_mm=None, **shape_thresholds
+):
+    """Measure N faces in one vectorized pass.
+
+    landmarks is an (N, 478, 3) array of normalized FaceMesh coordinates and
+    image_sizes either one (width, height) pair or an (N, 2) array. Returns a
+    dict of (N,) arrays, pixel distances in the original image resolution and
+    mm values. The scale comes from pixels_per_mm where it is given and
+    positive (e.g. a detected reference card), else from the jaw width.
+    """
+    landmarks = np.asarray(landmarks, dtype=np.float64)
+    if landmarks.ndim == 2:
+        landmarks = landmarks[None]
+    sizes = np.broadcast_to(np.asarray(image_sizes, dtype=np.float64), (landmarks.shape[0], 2))
+    points = landmarks[:, :, :2] * sizes[:, None, :]
+
+    def distance(a, b):
+        return np.linalg.norm(points[:, a] - points[:, b], axis=-1)
+
+    eye_center = (points[:, LEFT_PUPIL] + points[:, RIGHT_PUPIL]) / 2
+    pixels = {
+        "pd": distance(RIGHT_PUPIL, LEFT_PUPIL),
+        "pupil_height": np.linalg.norm(eye_center - points[:, TOP_OF_FACE], axis=-1),
+        "npd_left": distance(LEFT_PUPIL, NOSE_TIP),
+        "npd_right": distance(RIGHT_PUPIL, NOSE_TIP),
+        "jaw_width": distance(JAW_RIGHT, JAW_LEFT),
+        "cheekbone_width": distance(CHEEKBONE_RIGHT, CHEEKBONE_LEFT),
+        "forehead_width": distance(FOREHEAD_RIGHT, FOREHEAD_LEFT),
+        "face_length": distance(CHIN_BOTTOM, TOP_OF_FACE),
+    }
+
+    jaw = pixels["jaw_width"]
+    jaw_scale = np.where(jaw > 0, jaw / jaw_width_mm, 1.0)
+    if pixels_per_mm is None:
+        measured_scale = np.full(len(jaw), np.nan)
+    else:
+        measured_scale = np.broadcast_to(np.asarray(pixels_per_mm, dtype=np.float64), jaw.shape)
+    has_scale = np.isfinite(measured_scale) & (measured_scale > 0)
+    pixels_per_mm = np.where(has_scale, measured_scale, jaw_scale)
+
+    result = {
+        "pixels_per_mm": pixels_per_mm,
+        "scale_source": np.where(has_scale, SCALE_FROM_CARD, SCALE_FROM_JAW),
+    }
+    for name, value in pixels.items():
+        result[f"{name}_pixel"] = value
+        result[f"{name}_mm"] = value / pixels_per_mm
+
+    result["face_shape"] = classify_face_shapes(
+        result["face_length_mm"],
+        result["cheekbone_width_mm"],
+        result["jaw_width_mm"],
+        result["forehead_width_mm"],
+        **shape_thresholds,
+    )
+
+    # Accuracy and Symmetry
+    landmark_accuracy = landmarks.shape[1] / NUM_LANDMARKS * 100
+    pd_mm = result["pd_mm"]
+    symmetry_difference_mm = np.abs(result["npd_left_mm"] - result["npd_right_mm"])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        symmetry_score = np.where(pd_mm > 0, np.maximum(0, 100 - symmetry_difference_mm / pd_mm * 100), 0)
+    result["accuracy"] = np.round(landmark_accuracy * 0.6 + symmetry_score * 0.4, 2)
+    return result
+
+
+def pack_landmarks(landmarks, encoding="uint16"):
+    """Pack one face's (478, 3) normalized landmarks into little-endian bytes."""
+    landmarks = np.asarray(landmarks, dtype=np.float64)
+    if encoding == "float16":
+        return landmarks.astype("<f2").tobytes()
+    if encoding != "uint16":
+        raise ValueError(f"Unknown landmark encoding: {encoding}")
+    low, high = UINT16_RANGE
+    scaled = np.rint((landmarks - low) / (high - low) * 65535)
+    return np.clip(scaled, 0, 65535).astype("<u2").tobytes()
+
+
+def unpack_landmarks(data, encoding="uint16"):
+    """Inverse of pack_landmarks; returns a (478, 3) float64 array."""
+    if encoding not in LANDMARK_ENCODINGS:
+        raise ValueError(f"Unknown landmark encoding: {encoding}")
+    if len(data) != NUM_LANDMARKS * 3 * 2:
+        raise ValueError(f"Expected {NUM_LANDMARKS * 3 * 2} bytes of landmarks, got {len(data)}")
+    if encoding == "float16":
+        return np.frombuffer(data, dtype="<f2").astype(np.float64).reshape(NUM_LANDMARKS, 3)
+    low, high = UINT16_RANGE
+    values = np.frombuffer(data, dtype="<u2").astype(np.float64)
+    return (values / 65535 * (high - low) + low).reshape(NUM_LANDMARKS, 3)
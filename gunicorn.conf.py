@@ -0,0 +1,57 @@
+# Production serving for process_server.py:
+#   gunicorn -c gunicorn.conf.py process_server:app
+#
+# Each worker process imports the app itself (no preload), and post_worker_init
+# below starts its model warm-up after the fork; poll GET /ready to know when a
+# worker has loaded its FaceMesh pool and run a first inference.
+import os
+import shutil
+import tempfile
+
+# Use MEASURE_BIND=unix:/run/measure/measure.sock when the Node API runs on the
+# same host; it then connects with MEASURE_SOCKET set to that path.
+bind = os.environ.get("MEASURE_BIND", "127.0.0.1:6006")
+workers = int(os.environ.get("MEASURE_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+# Each worker lazily starts its own /process/batch pool of BATCH_WORKERS
+# processes, so split the cores between workers instead of giving every worker
+# one process per core (workers x cores MediaPipe processes in total).
+os.environ.setdefault("BATCH_WORKERS", str(max(1, (os.cpu_count() or 1) // workers)))
+worker_class = "gthread"
+
+# Enough threads per worker to hold the active and waiting requests the app's
+# admission controller allows, so overflow is rejected by the app with a 503
+# and Retry-After instead of sitting in gunicorn's accept queue.
+_pool_size = int(os.environ.get("FACE_MESH_POOL_SIZE", "2"))
+_max_active = int(os.environ.get("ADMISSION_MAX_ACTIVE", str(_pool_size)))
+_max_waiting = int(os.environ.get("ADMISSION_MAX_WAITING", str(4 * _pool_size)))
+threads = _max_active + _max_waiting + 1
+
+# Keep the kernel accept queue short; the Node caller gives up after 10 s anyway
+backlog = int(os.environ.get("MEASURE_BACKLOG", "64"))
+timeout = int(os.environ.get("MEASURE_WORKER_TIMEOUT", "60"))
+graceful_timeout = 30
+keepalive = 5
+
+# Workers share their request metrics through this directory, so /metrics
+# reports the sum over all workers whichever one answers the scrape
+os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), "measure-metrics"))
+
+
+def on_starting(server):
+    # Counters start from zero with each master, as with a single process
+    shutil.rmtree(os.environ["METRICS_DIR"], ignore_errors=True)
+    os.makedirs(os.environ["METRICS_DIR"])
+
+
+def post_worker_init(worker):
+    from process_server import start_warm_up
+
+    start_warm_up()
+
+
+def worker_exit(server, worker):
+    # Write out the series recorded since the last timed flush
+    from process_server import metrics
+
+    if metrics.directory:
+        metrics.flush()
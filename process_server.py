@@ -1,221 +1,2012 @@
-from flask import Flask, request, jsonify
+import time
+
+# Start of this module's import, for the startup timings reported by /ready
+_import_started = time.perf_counter()
+
+from flask import Flask, Request, g, has_request_context, request, jsonify
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict
+from contextlib import contextmanager
+import functools
 import cv2
-import mediapipe as mp
 import numpy as np
+import face_geometry
+import svg_raster
+from face_geometry import (
+    ASSUMED_JAW_WIDTH_MM,
+    LANDMARK_ENCODINGS,
+    LEFT_PUPIL,
+    RIGHT_PUPIL,
+    measure_faces,
+    pack_landmarks,
+    unpack_landmarks,
+)
+import base64
+import hashlib
+import importlib.metadata
+import io
+import json
+import logging
+import multiprocessing
+import queue
+import random
+import sqlite3
+import struct
+import tempfile
+import threading
 import uuid
 import os
 
+
+class InMemoryRequest(Request):
+    # Keep multipart file parts in memory instead of werkzeug's spooled temp files
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
+
+
 app = Flask(__name__)
-mp_face_mesh = mp.solutions.face_mesh
+app.request_class = InMemoryRequest
+logger = logging.getLogger("process_server")
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s %(message)s")
+
+
+
+def mediapipe_solutions():
+    # MediaPipe takes most of the import time, so it is loaded by the warm-up
+    # phase (or the first request) rather than when this module is imported
+    import mediapipe
+
+    return mediapipe.solutions
+
 
 # Standard credit card width in mm
 CREDIT_CARD_WIDTH_MM = 85.60
+CREDIT_CARD_HEIGHT_MM = 53.98
+
+# Reference card search around the face; falls back to the jaw-width scale when
+# no card is found within CARD_DETECTION_BUDGET_MS
+CARD_DETECTION = os.environ.get("CARD_DETECTION", "1") == "1"
+CARD_DETECTION_BUDGET_MS = float(os.environ.get("CARD_DETECTION_BUDGET_MS", "15"))
+CARD_SEARCH_MAX_SIDE = 480
+CARD_ASPECT_TOLERANCE = 0.12
+CARD_MIN_RECTANGULARITY = 0.9
+# Canny thresholds on the Cr and Cb channels, which vary far less than luma
+CARD_CHROMA_EDGES = (8, 16)
 
+# Cheap quality gate run before FaceMesh on a downscaled copy of the upload.
+# Exposure and sharpness are judged on the face box found by BlazeFace (the
+# detector FaceMesh itself starts with), so dark or blurred backgrounds pass.
+QUALITY_GATE = os.environ.get("QUALITY_GATE", "1") == "1"
+QUALITY_MAX_SIDE = 480
+# Mean face brightness (0-255) outside this range is rejected as badly exposed
+QUALITY_MIN_BRIGHTNESS = float(os.environ.get("QUALITY_MIN_BRIGHTNESS", "45"))
+QUALITY_MAX_BRIGHTNESS = float(os.environ.get("QUALITY_MAX_BRIGHTNESS", "220"))
+# Laplacian variance of the face resized to QUALITY_FACE_WIDTH pixels
+QUALITY_MIN_SHARPNESS = float(os.environ.get("QUALITY_MIN_SHARPNESS", "20"))
+QUALITY_FACE_WIDTH = 160
+# Faces narrower than this in original pixels give unreliable mm values
+QUALITY_MIN_FACE_PX = int(os.environ.get("QUALITY_MIN_FACE_PX", "150"))
+FACE_DETECTION_OPTIONS = {"model_selection": 0, "min_detection_confidence": 0.5}
+
+# Worker processes used by /process/batch, each holding its own warm FaceMesh
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", str(os.cpu_count() or 1)))
+MAX_BATCH_IMAGES = int(os.environ.get("MAX_BATCH_IMAGES", "64"))
+
+# /process/frames: a clip or frame sequence is tracked with FaceMesh in video
+# mode and stops early once the median PD, PH and NPD are stable to within
+# FRAMES_CONVERGENCE_MM (estimated standard error of the median)
+MAX_FRAMES = int(os.environ.get("MAX_FRAMES", "90"))
+MIN_FRAMES = int(os.environ.get("MIN_FRAMES", "8"))
+FRAMES_CONVERGENCE_MM = float(os.environ.get("FRAMES_CONVERGENCE_MM", "0.3"))
+MAX_VIDEO_BYTES = int(os.environ.get("MAX_VIDEO_BYTES", str(50 * 1024 * 1024)))
+
+# Longest side fed to FaceMesh; landmarks are mapped back to the original resolution.
+# 0 disables downscaling. INFERENCE_ROI_REFINE=1 re-runs FaceMesh on a crop of the
+# face taken from the full-resolution image for more precise iris landmarks.
+INFERENCE_MAX_SIDE = int(os.environ.get("INFERENCE_MAX_SIDE", "1280"))
+INFERENCE_ROI_REFINE = os.environ.get("INFERENCE_ROI_REFINE", "0") == "1"
+ROI_MARGIN = 0.25
+
+# Results for identical uploads are served from an LRU in memory and, when
+# RESULT_CACHE_DB is set, from an SQLite file that survives restarts
+RESULT_CACHE_ENTRIES = int(os.environ.get("RESULT_CACHE_ENTRIES", "1024"))
+RESULT_CACHE_TTL = float(os.environ.get("RESULT_CACHE_TTL", str(24 * 3600)))
+RESULT_CACHE_DB = os.environ.get("RESULT_CACHE_DB", "")
+RESULT_CACHE_DB_ENTRIES = int(os.environ.get("RESULT_CACHE_DB_ENTRIES", "100000"))
+
+# Colour-vision plates from PLATE_DIR are served as WebP/PNG (GET /plates/<name>)
+# at the first of PLATE_WIDTHS at least as wide as requested, so the variants
+# are a fixed set; encoded renders are kept in an LRU that by default
+# (PLATE_CACHE_ENTRIES=0) holds all of them, and PLATE_WARM_WIDTHS are
+# rendered in the background at startup
+PLATE_DIR = os.environ.get("PLATE_DIR", "ColorTestImages")
+PLATE_CACHE_ENTRIES = int(os.environ.get("PLATE_CACHE_ENTRIES", "0"))
+PLATE_WIDTHS = sorted(int(w) for w in os.environ.get("PLATE_WIDTHS", "360,720,1080,1440,2048").split(",") if w.strip())
+PLATE_WARM_WIDTHS = [int(w) for w in os.environ.get("PLATE_WARM_WIDTHS", "360,720,1080").split(",") if w.strip()]
+PLATE_DEFAULT_WIDTH = 720
+PLATE_FORMATS = {
+    "webp": ("image/webp", [cv2.IMWRITE_WEBP_QUALITY, 90]),
+    "png": ("image/png", [cv2.IMWRITE_PNG_COMPRESSION, 6]),
+}
+PLATE_MAX_AGE = 7 * 24 * 3600
+
+# Uploads are decoded in memory; set PERSIST_UPLOADS=1 to also keep a copy on disk
 UPLOAD_FOLDER = "measurementsImages"
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+PERSIST_UPLOADS = os.environ.get("PERSIST_UPLOADS", "0") == "1"
+if PERSIST_UPLOADS:
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+MAX_IMAGE_PIXELS = int(os.environ.get("MAX_IMAGE_PIXELS", str(64 * 1000 * 1000)))
+# /process also takes the image as the raw request body, skipping multipart
+# encoding; the client may name the file in this header for the request log
+RAW_IMAGE_TYPES = ("application/octet-stream", "image/jpeg", "image/png", "image/webp")
+FILENAME_HEADER = "X-Filename"
+# Leave headroom for the multipart envelope around the image itself
+MAX_REQUEST_BYTES = MAX_UPLOAD_BYTES + 64 * 1024
+MAX_BATCH_BYTES = int(os.environ.get("MAX_BATCH_BYTES", str(200 * 1024 * 1024)))
+# File parts are kept in memory, so the body limit is one image's worth except
+# on the routes that take several images or a clip (see start_request_timing)
+app.config["MAX_CONTENT_LENGTH"] = MAX_REQUEST_BYTES
+ROUTE_MAX_CONTENT_LENGTH = {
+    "process_batch": MAX_BATCH_BYTES,
+    # A clip, or a frame sequence sized like a batch
+    "process_frames": max(MAX_VIDEO_BYTES + 64 * 1024, MAX_BATCH_BYTES),
+}
 
-@app.route("/process", methods=["POST"])
-def process_image():
-    if "image" not in request.files:
-        print("No image file in request.")
-        return jsonify({"error": "No image file provided"}), 400
+# Number of pre-built FaceMesh graphs shared by the request threads of this worker
+FACE_MESH_POOL_SIZE = int(os.environ.get("FACE_MESH_POOL_SIZE", "2"))
+# Seconds a request waits for a free FaceMesh before giving up
+FACE_MESH_POOL_TIMEOUT = float(os.environ.get("FACE_MESH_POOL_TIMEOUT", "10"))
+# /process?faces=N measures up to N faces (at most MAX_FACES) from one FaceMesh
+# pass; group mode has its own pool, built on its first request
+MAX_FACES = int(os.environ.get("MAX_FACES", "8"))
+# Load the models and run one inference per pooled graph on a built-in image
+# when the server starts, before /ready reports ready
+STARTUP_WARMUP = os.environ.get("STARTUP_WARMUP", "1") == "1"
+
+# Admission control: at most ADMISSION_MAX_ACTIVE requests are processed at
+# once and at most ADMISSION_MAX_WAITING wait for a slot; the rest get a 503
+# with Retry-After straight away instead of queueing behind doomed work.
+ADMISSION_MAX_ACTIVE = int(os.environ.get("ADMISSION_MAX_ACTIVE", str(FACE_MESH_POOL_SIZE)))
+ADMISSION_MAX_WAITING = int(os.environ.get("ADMISSION_MAX_WAITING", str(4 * FACE_MESH_POOL_SIZE)))
+RETRY_AFTER_SECONDS = int(os.environ.get("RETRY_AFTER_SECONDS", "1"))
+# Clients send their remaining time budget so work they have given up on is skipped
+DEADLINE_HEADER = "X-Request-Timeout-Ms"
+
+# Fraction of requests written to the structured request log (0 disables it);
+# 5xx responses are always logged
+REQUEST_LOG_SAMPLE_RATE = float(os.environ.get("REQUEST_LOG_SAMPLE_RATE", "0"))
+# Latency histogram bucket upper bounds in seconds
+METRIC_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Directory shared by the gunicorn workers (see gunicorn.conf.py): each worker
+# writes its counters and histograms there after every request and /metrics
+# sums them all, so a scrape does not depend on which worker answers it
+METRICS_DIR = os.environ.get("METRICS_DIR", "")
+
+
+class MeasurementError(Exception):
+    # reason is a short, fixed label used for metrics and request logs
+    def __init__(self, message, status=422, reason="measurement_error"):
+        super().__init__(message)
+        self.status = status
+        self.reason = reason
+
+
+class UploadError(MeasurementError):
+    def __init__(self, message, status=400, reason="invalid_image"):
+        super().__init__(message, status, reason)
+
+
+class QualityError(MeasurementError):
+    # Rejected by the pre-inference quality gate; quality holds the scores that failed it
+    def __init__(self, message, reason, quality):
+        super().__init__(message, 422, reason)
+        self.quality = quality
+
+
+class Overloaded(MeasurementError):
+    def __init__(self, message="Server busy, please retry", status=503):
+        super().__init__(message, status, "overloaded")
+
+
+class DeadlineExceeded(MeasurementError):
+    def __init__(self, message="Request deadline exceeded", status=504):
+        super().__init__(message, status, "deadline_exceeded")
+
+
+class Metrics:
+    """Counters and histograms rendered in Prometheus text format.
+
+    Series are kept per process. With a directory, every process writes its
+    series there on flush() and render() sums the files of all processes,
+    including workers that have since exited, so counters never go backwards.
+    Request handlers call flush_soon(), which writes at most once per
+    FLUSH_INTERVAL, so another worker's scrape can lag by that much. Gauges
+    describe the answering process and carry a worker label.
+    """
+
+    FLUSH_INTERVAL = 1.0
+
+    HELP = {
+        "measure_stage_seconds": "Time spent in each pipeline stage.",
+        "measure_request_seconds": "End-to-end request handling time.",
+        "measure_requests_total": "Requests by endpoint, status code and outcome.",
+    }
+
+    def __init__(self, buckets, directory=""):
+        self.buckets = buckets
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flush_timer = None
+        self._counters = {}
+        self._histograms = {}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # Per-bucket counts, then sum and count
+                histogram = self._histograms[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[i] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+    def _snapshot(self):
+        with self._lock:
+            return dict(self._counters), {key: list(value) for key, value in self._histograms.items()}
 
-    file = request.files["image"]
-    if file.filename == "":
-        print("Empty filename received.")
-        return jsonify({"error": "Empty filename"}), 400
+    def flush(self):
+        """Write this process's series to the shared directory."""
+        counters, histograms = self._snapshot()
+        data = {
+            "counters": [[name, labels, value] for (name, labels), value in counters.items()],
+            "histograms": [[name, labels, value] for (name, labels), value in histograms.items()],
+        }
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        with self._flush_lock:
+            with open(path + ".tmp", "w") as f:
+                json.dump(data, f)
+            # Readers only ever see a complete file
+            os.replace(path + ".tmp", path)
 
-    temp_filename = os.path.join(UPLOAD_FOLDER, f"temp_{uuid.uuid4().hex}.jpg")
-    file.save(temp_filename)
-    print(f"Image received: {file.filename}, saved temporarily as: {temp_filename}")
+    def flush_soon(self):
+        """Flush within FLUSH_INTERVAL; series recorded meanwhile go out with it."""
+        with self._lock:
+            if self._flush_timer is not None:
+                return
+            timer = self._flush_timer = threading.Timer(self.FLUSH_INTERVAL, self._timed_flush)
+        timer.daemon = True
+        timer.start()
 
+    def _timed_flush(self):
+        with self._lock:
+            self._flush_timer = None
+        try:
+            self.flush()
+        except OSError:
+            logger.exception("Could not write metrics to %s", self.directory)
+
+    def _collect(self):
+        if not self.directory:
+            return self._snapshot()
+        self.flush()
+        counters, histograms = {}, {}
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, filename)) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, labels, value in data["counters"]:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, value in data["histograms"]:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                total = histograms.get(key)
+                histograms[key] = value if total is None else [a + b for a, b in zip(total, value)]
+        return counters, histograms
+
+    def render(self, gauges=None):
+        lines = []
+        counters, histograms = self._collect()
+        counters, histograms = sorted(counters.items()), sorted(histograms.items())
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# HELP {name} {self.HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{self._labels(labels)} {value}")
+        for (name, labels), histogram in histograms:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# HELP {name} {self.HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+            for bound, count in zip(self.buckets, histogram):
+                lines.append(f"{name}_bucket{self._labels(labels, [('le', bound)])} {count}")
+            lines.append(f"{name}_bucket{self._labels(labels, [('le', '+Inf')])} {histogram[-1]}")
+            lines.append(f"{name}_sum{self._labels(labels)} {histogram[-2]}")
+            lines.append(f"{name}_count{self._labels(labels)} {histogram[-1]}")
+        worker = [("worker", os.getpid())] if self.directory else []
+        for name, value in (gauges or {}).items():
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name}{self._labels(worker)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics(METRIC_BUCKETS, METRICS_DIR)
+
+
+@contextmanager
+def stage_timer(stage):
+    started = time.perf_counter()
     try:
-        image = cv2.imread(temp_filename)
-        if image is None:
-            print("Could not read image using OpenCV.")
-            return jsonify({"error": "Invalid image file"}), 400
-
-        h, w = image.shape[:2]
-
-        with mp_face_mesh.FaceMesh(
-            static_image_mode=True, max_num_faces=1, refine_landmarks=True
-        ) as face_mesh:
-            rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            results = face_mesh.process(rgb_image)
-
-            if not results.multi_face_landmarks:
-                print("No face detected.")
-                return jsonify({"error": "No face detected"}), 422
-
-            landmarks = results.multi_face_landmarks[0].landmark
-
-            # Validate sufficient landmarks, including iris points
-            if len(landmarks) < 478 or landmarks[468].x == 0 or landmarks[473].x == 0:
-                print("Insufficient or invalid facial landmarks detected.")
-                return jsonify({"error": "Incomplete facial landmarks detected"}), 422
-
-            # Key facial points extraction
-            left_pupil_pixel = np.array([landmarks[468].x * w, landmarks[468].y * h])
-            right_pupil_pixel = np.array([landmarks[473].x * w, landmarks[473].y * h])
-            nose_tip_pixel = np.array([landmarks[1].x * w, landmarks[1].y * h])
-            top_of_face_pixel = np.array([landmarks[10].x * w, landmarks[10].y * h])
-            chin_bottom_pixel = np.array([landmarks[152].x * w, landmarks[152].y * h])
-
-            # Facial width points
-            jaw_left_pixel = np.array([landmarks[454].x * w, landmarks[454].y * h])
-            jaw_right_pixel = np.array([landmarks[234].x * w, landmarks[234].y * h])
-            cheekbone_left_pixel = np.array([landmarks[323].x * w, landmarks[323].y * h])
-            cheekbone_right_pixel = np.array([landmarks[93].x * w, landmarks[93].y * h])
-            forehead_left_pixel = np.array([landmarks[301].x * w, landmarks[301].y * h])
-            forehead_right_pixel = np.array([landmarks[71].x * w, landmarks[71].y * h])
-
-            # Calculate pixel distances
-            pd_pixel = np.linalg.norm(right_pupil_pixel - left_pupil_pixel)
-            eye_center_pixel = (left_pupil_pixel + right_pupil_pixel) / 2
-            pupil_height_pixel = np.linalg.norm(eye_center_pixel - top_of_face_pixel)
-            npd_left_pixel = np.linalg.norm(left_pupil_pixel - nose_tip_pixel)
-            npd_right_pixel = np.linalg.norm(right_pupil_pixel - nose_tip_pixel)
-
-            jaw_width_pixel = np.linalg.norm(jaw_right_pixel - jaw_left_pixel)
-            cheekbone_width_pixel = np.linalg.norm(cheekbone_right_pixel - cheekbone_left_pixel)
-            forehead_width_pixel = np.linalg.norm(forehead_right_pixel - forehead_left_pixel)
-            face_length_pixel = np.linalg.norm(chin_bottom_pixel - top_of_face_pixel)
-
-            # Check for reference object (e.g., credit card or ruler) - simplified logic
-            # This is a placeholder; actual detection would require object recognition
-            pixels_per_mm = 1.0  # Default fallback
-            if jaw_width_pixel > 0:
-                # Rough estimate assuming average jaw width is ~130-150 mm for adults
-                pixels_per_mm = jaw_width_pixel / 140.0  # Adjustable average jaw width
-
-            print(f"Calculated pixels_per_mm (based on jaw width): {pixels_per_mm:.2f}")
-
-            # Convert pixel measurements to mm
-            pd_mm = pd_pixel / pixels_per_mm if pixels_per_mm > 0 else pd_pixel
-            pupil_height_mm = pupil_height_pixel / pixels_per_mm if pixels_per_mm > 0 else pupil_height_pixel
-            npd_left_mm = npd_left_pixel / pixels_per_mm if pixels_per_mm > 0 else npd_left_pixel
-            npd_right_mm = npd_right_pixel / pixels_per_mm if pixels_per_mm > 0 else npd_right_pixel
-            face_length_mm = face_length_pixel / pixels_per_mm if pixels_per_mm > 0 else face_length_pixel
-            cheekbone_width_mm = cheekbone_width_pixel / pixels_per_mm if pixels_per_mm > 0 else cheekbone_width_pixel
-            jaw_width_mm = jaw_width_pixel / pixels_per_mm if pixels_per_mm > 0 else jaw_width_pixel
-            forehead_width_mm = forehead_width_pixel / pixels_per_mm if pixels_per_mm > 0 else forehead_width_pixel
-
-            print(f"   Measurements (in pixels):")
-            print(f"   PD (pixels)        = {pd_pixel:.2f}")
-            print(f"   PH (pixels)        = {pupil_height_pixel:.2f}")
-            print(f"   NPD Left (pixels)  = {npd_left_pixel:.2f}")
-            print(f"   NPD Right (pixels) = {npd_right_pixel:.2f}")
-            print(f"   Face Length (pixels)= {face_length_pixel:.2f}")
-            print(f"   Cheekbone Width (pixels) = {cheekbone_width_pixel:.2f}")
-            print(f"   Jaw Width (pixels)       = {jaw_width_pixel:.2f}")
-            print(f"   Forehead Width (pixels) = {forehead_width_pixel:.2f}")
-
-            print(f"   Measurements (converted to mm):")
-            print(f"   Face Length       = {face_length_mm:.2f} mm")
-            print(f"   Cheekbone Width   = {cheekbone_width_mm:.2f} mm")
-            print(f"   Jaw Width         = {jaw_width_mm:.2f} mm")
-            print(f"   Forehead Width    = {forehead_width_mm:.2f} mm")
-
-            # Face Shape Determination
-            face_shape = "Unknown"
-            epsilon = 1e-6  # Prevent division by zero
-
-            measurements = {
-                "length": face_length_mm + epsilon,
-                "cheekbone": cheekbone_width_mm + epsilon,
-                "jaw": jaw_width_mm + epsilon,
-                "forehead": forehead_width_mm + epsilon,
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.observe("measure_stage_seconds", elapsed, stage=stage)
+        if has_request_context():
+            g.stages[stage] = round(elapsed * 1000, 3)
+        elif _worker_stages is not None:
+            _worker_stages.append((stage, elapsed))
+
+
+def log_fields(**fields):
+    # Extra context for the sampled request log line
+    if has_request_context():
+        g.log_fields.update(fields)
+
+
+class AdmissionController:
+    """Bounds in-flight and waiting requests, rejecting the overflow immediately."""
+
+    def __init__(self, max_active, max_waiting):
+        self.max_active = max(1, max_active)
+        self.max_waiting = max(0, max_waiting)
+        self._slots = threading.BoundedSemaphore(self.max_active)
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiting = 0
+        self._rejected = 0
+        self._expired = 0
+
+    @contextmanager
+    def admit(self, deadline=None):
+        with self._lock:
+            if self._waiting >= self.max_waiting and self._active >= self.max_active:
+                self._rejected += 1
+                raise Overloaded()
+            self._waiting += 1
+        try:
+            if deadline is None:
+                acquired = self._slots.acquire()
+            else:
+                acquired = self._slots.acquire(timeout=max(0.0, deadline - time.monotonic()))
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        if not acquired:
+            with self._lock:
+                self._expired += 1
+            raise DeadlineExceeded()
+
+        with self._lock:
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active -= 1
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_active": self.max_active,
+                "max_waiting": self.max_waiting,
+                "active": self._active,
+                "waiting": self._waiting,
+                "rejected": self._rejected,
+                "expired": self._expired,
             }
 
-            ratios = {
-                "length_to_width": measurements["length"] / measurements["cheekbone"],
-                "jaw_to_cheekbone": measurements["jaw"] / measurements["cheekbone"],
-                "forehead_to_cheekbone": measurements["forehead"] / measurements["cheekbone"],
-                "forehead_to_jaw": measurements["forehead"] / measurements["jaw"],
+
+admission = AdmissionController(ADMISSION_MAX_ACTIVE, ADMISSION_MAX_WAITING)
+
+
+def request_deadline():
+    # Monotonic deadline from the client's remaining budget, or None without one
+    value = request.headers.get(DEADLINE_HEADER)
+    if not value:
+        return None
+    try:
+        return time.monotonic() + max(0.0, float(value)) / 1000
+    except ValueError:
+        return None
+
+
+def check_deadline(deadline):
+    if deadline is not None and time.monotonic() >= deadline:
+        raise DeadlineExceeded()
+
+
+def error_payload(e):
+    payload = {"error": str(e)}
+    if isinstance(e, QualityError):
+        payload["reason"] = e.reason
+        payload["Image Quality"] = e.quality
+    return payload
+
+
+def error_response(e):
+    if has_request_context():
+        g.outcome = e.reason
+    headers = {"Retry-After": str(RETRY_AFTER_SECONDS)} if e.status == 503 else {}
+    return jsonify(error_payload(e)), e.status, headers
+
+
+def admission_controlled(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        deadline = request_deadline()
+        try:
+            with admission.admit(deadline):
+                return view(*args, deadline=deadline, **kwargs)
+        except (Overloaded, DeadlineExceeded) as e:
+            return error_response(e)
+
+    return wrapper
+
+
+class FaceMeshPool:
+    """Fixed-size pool of warm FaceMesh instances checked out per request.
+
+    A FaceMesh graph is not safe to share between threads, so each request
+    borrows one exclusively and returns it when done. Building the graph is
+    the expensive part, so instances are created once and reused. Other
+    MediaPipe solutions can be pooled the same way by passing a factory.
+    """
+
+    def __init__(self, size, timeout, factory=None, **face_mesh_kwargs):
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.factory = factory or functools.partial(mediapipe_solutions().face_mesh.FaceMesh, **face_mesh_kwargs)
+        self._idle = queue.LifoQueue(maxsize=self.size)
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        for _ in range(self.size):
+            self._idle.put(self.factory())
+
+    @contextmanager
+    def checkout(self):
+        started = time.perf_counter()
+        try:
+            face_mesh = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            with self._lock:
+                self._timeouts += 1
+            raise TimeoutError("No FaceMesh instance available")
+        waited = time.perf_counter() - started
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+        try:
+            yield face_mesh
+        except MeasurementError:
+            raise
+        except Exception:
+            # A failure inside the graph may leave it in a bad state, so
+            # replace it instead of handing it to the next request.
+            face_mesh.close()
+            face_mesh = self.factory()
+            raise
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._idle.put(face_mesh)
+
+    def stats(self):
+        with self._lock:
+            checkouts = self._checkouts
+            return {
+                "size": self.size,
+                "in_use": self._in_use,
+                "idle": self.size - self._in_use,
+                "checkouts": checkouts,
+                "timeouts": self._timeouts,
+                "avg_wait_ms": round(self._total_wait / checkouts * 1000, 3) if checkouts else 0.0,
+                "max_wait_ms": round(self._max_wait * 1000, 3),
             }
 
-            # Classification thresholds
-            TIGHT_SIMILARITY = 0.10
-            MODERATE_SIMILARITY = 0.15
-            SIGNIFICANT_DIFFERENCE = 0.25
-
-            if (
-                abs(ratios["length_to_width"] - 1) <= 0.2
-                and abs(ratios["forehead_to_cheekbone"] - 1) <= TIGHT_SIMILARITY
-                and abs(ratios["jaw_to_cheekbone"] - 1) <= TIGHT_SIMILARITY
-            ):
-                face_shape = "Square"
-            elif (
-                ratios["jaw_to_cheekbone"] < (1 - SIGNIFICANT_DIFFERENCE)
-                and ratios["forehead_to_cheekbone"] < (1 - SIGNIFICANT_DIFFERENCE)
-                and ratios["length_to_width"] > (1 + MODERATE_SIMILARITY)
-            ):
-                face_shape = "Diamond"
-            elif (
-                ratios["forehead_to_cheekbone"] > (1 + MODERATE_SIMILARITY)
-                and ratios["forehead_to_jaw"] > (1 + SIGNIFICANT_DIFFERENCE)
-            ):
-                face_shape = "Heart"
-            elif (
-                ratios["jaw_to_cheekbone"] > (1 + MODERATE_SIMILARITY)
-                and ratios["forehead_to_jaw"] < (1 - SIGNIFICANT_DIFFERENCE)
-            ):
-                face_shape = "Triangle"
-            elif (
-                abs(ratios["length_to_width"] - 1) <= MODERATE_SIMILARITY
-                and abs(ratios["forehead_to_cheekbone"] - 1) <= MODERATE_SIMILARITY
-                and abs(ratios["jaw_to_cheekbone"] - 1) <= MODERATE_SIMILARITY
-            ):
-                face_shape = "Round"
-            elif (
-                ratios["length_to_width"] > (1 + SIGNIFICANT_DIFFERENCE)
-                and abs(ratios["forehead_to_cheekbone"] - 1) <= MODERATE_SIMILARITY
-                and abs(ratios["jaw_to_cheekbone"] - 1) <= MODERATE_SIMILARITY
-            ):
-                face_shape = "Rectangle"
-            else:
-                face_shape = "Oval"
+    def warm(self, run):
+        """Call run(instance) once on every idle pooled instance, e.g. a first inference.
 
-            # Accuracy and Symmetry
-            detected_landmarks = len(landmarks)
-            landmark_accuracy = (detected_landmarks / 478) * 100
-            symmetry_difference_mm = abs(npd_left_mm - npd_right_mm)
-            symmetry_score = max(0, 100 - (symmetry_difference_mm / pd_mm * 100)) if pd_mm > 0 else 0
-            final_accuracy = round((landmark_accuracy * 0.6 + symmetry_score * 0.4), 2)
+        Instances held by requests for longer than the pool timeout are
+        skipped; serving a request warms them anyway.
+        """
+        instances = []
+        try:
+            for _ in range(self.size):
+                try:
+                    instances.append(self._idle.get(timeout=self.timeout))
+                except queue.Empty:
+                    logger.info("Warmed %d of %d pooled instances; the rest are in use", len(instances), self.size)
+                    break
+            return [run(instance) for instance in instances]
+        finally:
+            for instance in instances:
+                self._idle.put(instance)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+def read_upload(stream, limit=MAX_UPLOAD_BYTES):
+    # Read one byte past the limit so oversized uploads are detected without buffering them
+    data = stream.read(limit + 1)
+    if len(data) > limit:
+        raise UploadError(f"Image exceeds {limit} bytes", 413, "too_large")
+    if not data:
+        raise UploadError("Empty image file")
+    return data
 
-            print(
-                f"Face processed. PD: {pd_mm:.1f} mm, PH: {pupil_height_mm:.1f} mm, Shape: {face_shape}, Accuracy: {final_accuracy}%"
-            )
 
-            return jsonify(
-                {
-                    "Pupillary Distance (PD)": f"{pd_mm:.1f} mm",
-                    "Pupil Height (PH)": f"{pupil_height_mm:.1f} mm",
-                    "Naso-Pupillary Distance (NPD)": {
-                        "Left Eye": f"{npd_left_mm:.1f} mm",
-                        "Right Eye": f"{npd_right_mm:.1f} mm",
-                    },
-                    "Face Shape": face_shape,
-                    "Measurement Accuracy": f"{final_accuracy}%",
-                    "Detailed Measurements": {
-                        "Face Length (mm)": round(face_length_mm, 2),
-                        "Cheekbone Width (mm)": round(cheekbone_width_mm, 2),
-                        "Jaw Width (mm)": round(jaw_width_mm, 2),
-                        "Forehead Width (mm)": round(forehead_width_mm, 2),
-                    },
-                    "Message": "These measurements were estimated using computer vision technology and an assumed scale. For confirmation, please consult a certified professional with proper measuring tools, ideally by using an image with a known reference object.",
-                }
+def _jpeg_size(buf):
+    view = memoryview(buf)
+    pos = 2
+    while pos + 4 <= len(view):
+        if view[pos] != 0xFF:
+            return None
+        marker = view[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            pos += 2
+            continue
+        (segment_length,) = struct.unpack_from(">H", view, pos + 2)
+        # SOFn markers carry the frame size; C4, C8 and CC are not frames
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            if pos + 9 > len(view):
+                return None
+            height, width = struct.unpack_from(">HH", view, pos + 5)
+            return width, height
+        pos += 2 + segment_length
+    return None
+
+
+def sniff_image_size(buf):
+    """Return (width, height) from the image header without decoding pixels."""
+    if buf[:3] == b"\xff\xd8\xff":
+        return _jpeg_size(buf)
+    if buf[:8] == b"\x89PNG\r\n\x1a\n" and len(buf) >= 24:
+        return struct.unpack_from(">II", buf, 16)
+    if buf[:4] == b"RIFF" and buf[8:12] == b"WEBP" and len(buf) >= 30:
+        chunk = buf[12:16]
+        if chunk == b"VP8 ":
+            width, height = struct.unpack_from("<HH", buf, 26)
+            return width & 0x3FFF, height & 0x3FFF
+        if chunk == b"VP8L":
+            bits = int.from_bytes(buf[21:25], "little")
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X":
+            return int.from_bytes(buf[24:27], "little") + 1, int.from_bytes(buf[27:30], "little") + 1
+    return None
+
+
+def _reduced_decode_flag(width, height, max_side):
+    # libjpeg can decode directly at 1/2, 1/4 or 1/8 scale, skipping most of the IDCT work
+    if max_side > 0:
+        for factor, flag in (
+            (8, cv2.IMREAD_REDUCED_COLOR_8),
+            (4, cv2.IMREAD_REDUCED_COLOR_4),
+            (2, cv2.IMREAD_REDUCED_COLOR_2),
+        ):
+            if max(width, height) / factor >= max_side:
+                return flag
+    return cv2.IMREAD_COLOR
+
+
+def decode_image(data, max_side=0):
+    """Decode an upload, returning the image and its original (width, height).
+
+    With max_side set the image may be decoded at a reduced scale that is
+    still at least max_side on its longest edge.
+    """
+    size = sniff_image_size(data)
+    if size is None:
+        raise UploadError("Unsupported or corrupt image file")
+    width, height = size
+    if width <= 0 or height <= 0:
+        raise UploadError("Invalid image dimensions")
+    if width * height > MAX_IMAGE_PIXELS:
+        raise UploadError(f"Image exceeds {MAX_IMAGE_PIXELS} pixels", 413, "too_large")
+    flag = _reduced_decode_flag(width, height, max_side)
+    with stage_timer("decode"):
+        image = cv2.imdecode(np.frombuffer(memoryview(data), dtype=np.uint8), flag)
+    if image is None:
+        raise UploadError("Invalid image file")
+    # EXIF orientation is applied on decode, so follow the decoded aspect
+    if (image.shape[1] > image.shape[0]) != (width > height):
+        width, height = height, width
+    return image, (width, height)
+
+
+def decode_max_side():
+    # The ROI pass crops from the full-resolution image, so only decode reduced without it
+    return 0 if INFERENCE_ROI_REFINE else INFERENCE_MAX_SIDE
+
+
+def resize_for_inference(image, max_side):
+    h, w = image.shape[:2]
+    if max_side <= 0 or max(h, w) <= max_side:
+        return image
+    scale = max_side / max(h, w)
+    return cv2.resize(image, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+
+
+def persist_upload(data):
+    filename = os.path.join(UPLOAD_FOLDER, f"upload_{uuid.uuid4().hex}.jpg")
+    with open(filename, "wb") as f:
+        f.write(data)
+    return filename
+
+
+FACE_MESH_OPTIONS = {"static_image_mode": True, "max_num_faces": 1, "refine_landmarks": True}
+
+
+class ResultCache:
+    """Bounded cache of (status, payload) keyed by upload content.
+
+    The key mixes in every setting that changes the result, so editing the
+    configuration naturally misses on entries produced under the old one.
+    """
+
+    # The SQLite tier is trimmed back to db_max_entries once per this many stores
+    DB_TRIM_INTERVAL = 256
+    # The disk tier is shared by every worker and optional, so a locked database
+    # is a miss or a skipped store after this long rather than a stalled request
+    DB_TIMEOUT = 0.25
+
+    def __init__(self, max_entries, ttl, db_path="", db_max_entries=0, params=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_max_entries = db_max_entries
+        self.fingerprint = json.dumps(params or {}, sort_keys=True).encode()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "expired": 0,
+            "db_errors": 0,
+        }
+        self._db = None
+        # SQLite work runs under its own lock, so memory hits never wait on the disk tier
+        self._db_lock = threading.Lock()
+        self._db_stores = 0
+        if db_path:
+            self._db = sqlite3.connect(db_path, timeout=self.DB_TIMEOUT, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, status INTEGER, payload TEXT, created REAL)"
             )
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_created ON results (created)")
+
+    def key(self, data, variant=""):
+        # variant separates response shapes of the same upload, e.g. with landmarks included
+        digest = hashlib.sha256(self.fingerprint)
+        if variant:
+            digest.update(variant.encode())
+        digest.update(data)
+        return digest.hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created, status, payload = entry
+                if now - created <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    return status, payload
+                del self._entries[key]
+                self._counters["expired"] += 1
+
+        if self._db is not None:
+            try:
+                with self._db_lock:
+                    row = self._db.execute(
+                        "SELECT status, payload, created FROM results WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row is not None and now - row[2] > self.ttl:
+                        self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+            except sqlite3.Error as e:
+                self._db_error("read", e)
+                row = None
+            if row is not None and now - row[2] <= self.ttl:
+                status, payload = row[0], json.loads(row[1])
+                with self._lock:
+                    self._remember(key, row[2], status, payload)
+                    self._counters["disk_hits"] += 1
+                return status, payload
+            if row is not None:
+                with self._lock:
+                    self._counters["expired"] += 1
+
+        with self._lock:
+            self._counters["misses"] += 1
+        return None
+
+    def put(self, key, status, payload):
+        created = time.time()
+        with self._lock:
+            self._remember(key, created, status, payload)
+            self._counters["stores"] += 1
+        if self._db is None:
+            return
+        serialized = json.dumps(payload)
+        try:
+            with self._db_lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results (key, status, payload, created) VALUES (?, ?, ?, ?)",
+                    (key, status, serialized, created),
+                )
+                self._db_stores += 1
+                if self._db_stores % self.DB_TRIM_INTERVAL == 0:
+                    self._trim(created)
+        except sqlite3.Error as e:
+            self._db_error("write", e)
+
+    def _db_error(self, action, error):
+        logger.warning("Result cache %s failed, skipping the disk tier: %s", action, error)
+        with self._lock:
+            self._counters["db_errors"] += 1
+
+    def _trim(self, now):
+        # Expired rows and anything beyond the cap, oldest first; between trims the
+        # table may run up to DB_TRIM_INTERVAL rows over db_max_entries
+        self._db.execute("DELETE FROM results WHERE created < ?", (now - self.ttl,))
+        self._db.execute(
+            "DELETE FROM results WHERE created < "
+            "(SELECT created FROM results ORDER BY created DESC LIMIT 1 OFFSET ?)",
+            (max(0, self.db_max_entries - 1),),
+        )
+
+    def _remember(self, key, created, status, payload):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (created, status, payload)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters, entries=len(self._entries), max_entries=self.max_entries)
+        if self._db is not None:
+            try:
+                with self._db_lock:
+                    stats["disk_entries"] = self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            except sqlite3.Error as e:
+                self._db_error("count", e)
+        return stats
+
+
+# Everything that changes the landmarks, the detected scale or the quality
+# verdict for an image; the geometry settings only change the arithmetic after
+INFERENCE_SETTINGS = {
+    "face_mesh": FACE_MESH_OPTIONS,
+    "inference_max_side": INFERENCE_MAX_SIDE,
+    "roi_refine": INFERENCE_ROI_REFINE,
+    "card_detection": [
+        CARD_DETECTION,
+        CARD_SEARCH_MAX_SIDE,
+        CARD_ASPECT_TOLERANCE,
+        CARD_MIN_RECTANGULARITY,
+        CARD_CHROMA_EDGES,
+        CREDIT_CARD_WIDTH_MM,
+    ],
+    "quality_gate": [
+        QUALITY_GATE,
+        QUALITY_MIN_BRIGHTNESS,
+        QUALITY_MAX_BRIGHTNESS,
+        QUALITY_MIN_SHARPNESS,
+        QUALITY_MIN_FACE_PX,
+    ],
+    "mediapipe": importlib.metadata.version("mediapipe"),
+}
+
+result_cache = ResultCache(
+    RESULT_CACHE_ENTRIES,
+    RESULT_CACHE_TTL,
+    RESULT_CACHE_DB,
+    RESULT_CACHE_DB_ENTRIES,
+    params={
+        **INFERENCE_SETTINGS,
+        "jaw_width_mm": ASSUMED_JAW_WIDTH_MM,
+        "shape_thresholds": [
+            face_geometry.TIGHT_SIMILARITY,
+            face_geometry.MODERATE_SIMILARITY,
+            face_geometry.SIGNIFICANT_DIFFERENCE,
+        ],
+    },
+)
+
+class PlateCache:
+    """LRU of rendered plates keyed by (name, width, format), each with an ETag.
+
+    SVGs are parsed on first use and kept; renders are encoded once and
+    served from memory until evicted.
+    """
+
+    def __init__(self, directory, max_entries):
+        self.directory = directory
+        self.names = set()
+        if os.path.isdir(directory):
+            self.names = {name[:-4] for name in os.listdir(directory) if name.endswith(".svg")}
+        self._plates = {}
+        self.max_entries = max_entries or max(1, len(self.names) * len(PLATE_WIDTHS) * len(PLATE_FORMATS))
+        self._renders = OrderedDict()
+        self._lock = threading.Lock()
+        # A cold render holds a request thread for 0.1-0.6 s; one at a time
+        # keeps a burst of them from starving the measurement routes
+        self._render_lock = threading.Lock()
+        # Parsing the larger plates takes most of a second, so do each once
+        self._parse_lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def _plate(self, name):
+        with self._parse_lock:
+            if name not in self._plates:
+                with open(os.path.join(self.directory, name + ".svg")) as f:
+                    self._plates[name] = svg_raster.Plate(f.read())
+            return self._plates[name]
+
+    def get(self, name, width, fmt):
+        key = (name, width, fmt)
+        with self._lock:
+            entry = self._renders.get(key)
+            if entry is not None:
+                self._renders.move_to_end(key)
+                self._counters["hits"] += 1
+                return entry
+            self._counters["misses"] += 1
+
+        with self._render_lock:
+            # Another request may have rendered it while this one waited
+            with self._lock:
+                entry = self._renders.get(key)
+            if entry is not None:
+                return entry
+            with stage_timer("plate_render"):
+                image = self._plate(name).render(width)
+                ok, encoded = cv2.imencode("." + fmt, image, PLATE_FORMATS[fmt][1])
+            if not ok:
+                raise RuntimeError(f"Could not encode plate {name} as {fmt}")
+            data = encoded.tobytes()
+            entry = (data, hashlib.sha256(data).hexdigest()[:32])
+            with self._lock:
+                self._renders[key] = entry
+                self._renders.move_to_end(key)
+                while len(self._renders) > self.max_entries:
+                    self._renders.popitem(last=False)
+                    self._counters["evictions"] += 1
+        return entry
+
+    def warm(self, widths, formats):
+        started = time.perf_counter()
+        for name in sorted(self.names):
+            for width in widths:
+                for fmt in formats:
+                    try:
+                        self.get(name, width, fmt)
+                    except Exception:
+                        logger.exception("Could not pre-render plate %s", name)
+        logger.info("Pre-rendered %d plate variants in %.1f s", len(self._renders), time.perf_counter() - started)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._renders),
+                "bytes": sum(len(data) for data, _ in self._renders.values()),
+                **self._counters,
+            }
 
+
+plate_cache = PlateCache(PLATE_DIR, PLATE_CACHE_ENTRIES)
+
+_face_mesh_pool = None
+_face_mesh_pool_lock = threading.Lock()
+
+
+def get_face_mesh_pool():
+    global _face_mesh_pool
+    if _face_mesh_pool is None:
+        with _face_mesh_pool_lock:
+            if _face_mesh_pool is None:
+                _face_mesh_pool = FaceMeshPool(FACE_MESH_POOL_SIZE, FACE_MESH_POOL_TIMEOUT, **FACE_MESH_OPTIONS)
+    return _face_mesh_pool
+
+
+_face_detection_pool = None
+
+
+def get_face_detection_pool():
+    global _face_detection_pool
+    if _face_detection_pool is None:
+        with _face_mesh_pool_lock:
+            if _face_detection_pool is None:
+                _face_detection_pool = FaceMeshPool(
+                    FACE_MESH_POOL_SIZE,
+                    FACE_MESH_POOL_TIMEOUT,
+                    factory=functools.partial(mediapipe_solutions().face_detection.FaceDetection, **FACE_DETECTION_OPTIONS),
+                )
+    return _face_detection_pool
+
+
+_group_face_mesh_pool = None
+
+
+def get_group_face_mesh_pool():
+    global _group_face_mesh_pool
+    if _group_face_mesh_pool is None:
+        with _face_mesh_pool_lock:
+            if _group_face_mesh_pool is None:
+                _group_face_mesh_pool = FaceMeshPool(
+                    FACE_MESH_POOL_SIZE, FACE_MESH_POOL_TIMEOUT, **dict(FACE_MESH_OPTIONS, max_num_faces=MAX_FACES)
+                )
+    return _group_face_mesh_pool
+
+
+class Lifecycle:
+    """Startup phase (starting, loading_models, warming_up, ready or failed) and timings."""
+
+    def __init__(self, import_started):
+        self._started = import_started
+        self._lock = threading.Lock()
+        self.phase = "starting"
+        self.error = None
+        self.timings_ms = {}
+        self.landmarks_found = None
+
+    def mark(self, name, since):
+        # Milliseconds from since to now, recorded under name
+        elapsed = (time.perf_counter() - since) * 1000
+        with self._lock:
+            self.timings_ms[name] = round(elapsed, 1)
+        return elapsed
+
+    def set_phase(self, phase, error=None):
+        with self._lock:
+            self.phase = phase
+            if error is not None:
+                self.error = error
+        if phase in ("ready", "failed"):
+            self.mark("total_ms", self._started)
+
+    @property
+    def ready(self):
+        return self.phase == "ready"
+
+    def stats(self):
+        with self._lock:
+            return {
+                "ready": self.phase == "ready",
+                "phase": self.phase,
+                "error": self.error,
+                "timings_ms": dict(self.timings_ms),
+                "warmup_landmarks_found": self.landmarks_found,
+                "mediapipe": INFERENCE_SETTINGS["mediapipe"],
+            }
+
+    def gauges(self):
+        with self._lock:
+            gauges = {"ready": int(self.phase == "ready")}
+            for name, value in self.timings_ms.items():
+                gauges[f"{name[:-3]}_seconds"] = value / 1000
+            return gauges
+
+
+lifecycle = Lifecycle(_import_started)
+
+
+def synthetic_face(size=256):
+    """A drawn cartoon face that BlazeFace and FaceMesh both pick up, for warm-up inferences."""
+    image = np.full((size, size, 3), 200, np.uint8)
+    s = size / 256
+
+    def at(x, y):
+        return int(x * s), int(y * s)
+
+    cv2.ellipse(image, at(128, 135), (int(70 * s), int(92 * s)), 0, 0, 360, (150, 180, 225), -1)
+    cv2.ellipse(image, at(128, 60), (int(74 * s), int(40 * s)), 0, 180, 360, (40, 40, 60), -1)
+    for x in (100, 156):
+        cv2.ellipse(image, at(x, 118), (int(15 * s), int(8 * s)), 0, 0, 360, (255, 255, 255), -1)
+        cv2.circle(image, at(x, 118), int(6 * s), (60, 40, 30), -1)
+        cv2.line(image, at(x - 16, 100), at(x + 16, 98), (50, 50, 70), max(1, int(4 * s)))
+    cv2.line(image, at(128, 125), at(122, 160), (120, 140, 190), max(1, int(3 * s)))
+    cv2.ellipse(image, at(128, 185), (int(24 * s), int(9 * s)), 0, 0, 180, (90, 90, 170), max(1, int(4 * s)))
+    return cv2.GaussianBlur(image, (0, 0), 1.5 * s)
+
+
+def warm_up():
+    """Load MediaPipe, build the pools and run a first inference on every pooled graph."""
+    try:
+        lifecycle.set_phase("loading_models")
+        started = time.perf_counter()
+        mediapipe_solutions()
+        lifecycle.mark("import_mediapipe_ms", started)
+        started = time.perf_counter()
+        pools = [get_face_mesh_pool()]
+        if QUALITY_GATE:
+            pools.append(get_face_detection_pool())
+        lifecycle.mark("load_models_ms", started)
+
+        lifecycle.set_phase("warming_up")
+        image = synthetic_face()
+        rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        started = time.perf_counter()
+        found = pools[0].warm(lambda face_mesh: bool(face_mesh.process(rgb).multi_face_landmarks))
+        for pool in pools[1:]:
+            pool.warm(lambda model: model.process(rgb))
+        lifecycle.mark("warmup_inference_ms", started)
+        lifecycle.landmarks_found = all(found)
+        if not lifecycle.landmarks_found:
+            logger.warning("Warm-up image gave no landmarks; the graphs are loaded but may be cold")
+        lifecycle.set_phase("ready")
     except Exception as e:
-        print(f"Error while processing image: {str(e)}")
+        logger.exception("Warm-up failed")
+        lifecycle.set_phase("failed", error=str(e))
+    logger.info(json.dumps({"event": "startup", **lifecycle.stats()}))
+
+
+_warm_up_started = False
+
+
+def start_warm_up():
+    """Start the model warm-up and plate pre-rendering in the background, once per process."""
+    global _warm_up_started
+    with _face_mesh_pool_lock:
+        if _warm_up_started:
+            return
+        _warm_up_started = True
+    if STARTUP_WARMUP:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    else:
+        lifecycle.set_phase("ready")
+    if PLATE_WARM_WIDTHS and plate_cache.names:
+        threading.Thread(target=plate_cache.warm, args=(PLATE_WARM_WIDTHS, PLATE_FORMATS), daemon=True).start()
+
+
+def face_points(face_landmarks):
+    landmarks = face_landmarks.landmark
+
+    # Validate sufficient landmarks, including iris points
+    if len(landmarks) < 478 or landmarks[468].x == 0 or landmarks[473].x == 0:
+        return None
+
+    # Normalized (x, y, z) per landmark, independent of the inference resolution
+    return np.array([(lm.x, lm.y, lm.z) for lm in landmarks], dtype=np.float64)
+
+
+def extract_landmarks(results):
+    if not results.multi_face_landmarks:
+        raise MeasurementError("No face detected", reason="no_face")
+    points = face_points(results.multi_face_landmarks[0])
+    if points is None:
+        raise MeasurementError("Incomplete facial landmarks detected", reason="incomplete_landmarks")
+    return points
+
+
+def extract_all_landmarks(results):
+    """(N, 478, 3) landmarks of every face with complete landmarks."""
+    if not results.multi_face_landmarks:
+        raise MeasurementError("No face detected", reason="no_face")
+    faces = [points for points in map(face_points, results.multi_face_landmarks) if points is not None]
+    if not faces:
+        raise MeasurementError("Incomplete facial landmarks detected", reason="incomplete_landmarks")
+    return np.stack(faces)
+
+
+def refine_in_roi(image, points, face_mesh):
+    h, w = image.shape[:2]
+    xs, ys = points[:, 0] * w, points[:, 1] * h
+    x_min, x_max, y_min, y_max = xs.min(), xs.max(), ys.min(), ys.max()
+    margin = ROI_MARGIN * max(x_max - x_min, y_max - y_min)
+    x0, y0 = max(0, int(x_min - margin)), max(0, int(y_min - margin))
+    x1, y1 = min(w, int(x_max + margin) + 1), min(h, int(y_max + margin) + 1)
+    if x1 - x0 < 2 or y1 - y0 < 2:
+        return points
+
+    crop = resize_for_inference(image[y0:y1, x0:x1], INFERENCE_MAX_SIDE)
+    results = face_mesh.process(cv2.cvtColor(crop, cv2.COLOR_BGR2RGB))
+    try:
+        roi_points = extract_landmarks(results)
+    except MeasurementError:
+        # Keep the coarse pass rather than failing a face we already found
+        return points
+
+    crop_w, crop_h = x1 - x0, y1 - y0
+    refined = np.empty_like(roi_points)
+    refined[:, 0] = (roi_points[:, 0] * crop_w + x0) / w
+    refined[:, 1] = (roi_points[:, 1] * crop_h + y0) / h
+    refined[:, 2] = roi_points[:, 2] * crop_w / w
+    return refined
+
+
+def check_exposure(brightness, quality):
+    if brightness < QUALITY_MIN_BRIGHTNESS:
+        raise QualityError("Image is too dark, please retake the photo in better light", "underexposed", quality)
+    if brightness > QUALITY_MAX_BRIGHTNESS:
+        raise QualityError("Image is overexposed, please avoid direct light on the face", "overexposed", quality)
+
+
+def quality_image(image):
+    # INTER_LINEAR keeps this cheap on full-resolution decodes; BlazeFace does not need INTER_AREA
+    scale = min(1.0, QUALITY_MAX_SIDE / max(image.shape[:2]))
+    return cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR) if scale < 1.0 else image
+
+
+def detect_face_boxes(small, face_detection):
+    """BlazeFace (score, (left, top, right, bottom)) per face, normalized and most confident first."""
+    results = face_detection.process(cv2.cvtColor(small, cv2.COLOR_BGR2RGB))
+    boxes = []
+    for detection in results.detections or []:
+        box = detection.location_data.relative_bounding_box
+        edges = (max(0.0, box.xmin), max(0.0, box.ymin), min(1.0, box.xmin + box.width), min(1.0, box.ymin + box.height))
+        boxes.append((float(detection.score[0]), edges))
+    return sorted(boxes, key=lambda item: item[0], reverse=True)
+
+
+def assess_quality(image, face_detection, original_size=None, boxes=None):
+    """Score exposure, face size and sharpness before FaceMesh runs.
+
+    Everything but the sharpness crop works on a QUALITY_MAX_SIDE copy, so
+    the gate costs a few milliseconds. The most confident face is checked,
+    from boxes when the caller already ran detect_face_boxes. Returns the
+    scores, or raises QualityError for the first check that fails.
+    """
+    w = (original_size or (image.shape[1], image.shape[0]))[0]
+    with stage_timer("quality"):
+        small = quality_image(image)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        quality = {"brightness": round(float(gray.mean()), 1)}
+
+        if boxes is None:
+            boxes = detect_face_boxes(small, face_detection)
+        if not boxes:
+            # A face may be missed because the whole image is too dark or bright, which is the more useful answer
+            check_exposure(quality["brightness"], quality)
+            raise QualityError("No face detected", "no_face", quality)
+
+        score, (left, top, right, bottom) = boxes[0]
+        sh, sw = gray.shape
+        face = gray[int(top * sh) : int(bottom * sh), int(left * sw) : int(right * sw)]
+        quality["detection_score"] = round(score, 3)
+        quality["face_width_px"] = int((right - left) * w)
+        quality["face_brightness"] = round(float(face.mean()), 1) if face.size else quality["brightness"]
+        check_exposure(quality["face_brightness"], quality)
+        if quality["face_width_px"] < QUALITY_MIN_FACE_PX:
+            raise QualityError("Face is too small in the image, please move closer to the camera", "face_too_small", quality)
+
+        # Sharpness on the face at a fixed width, so the score does not depend on the upload's resolution
+        ih, iw = image.shape[:2]
+        crop = image[int(top * ih) : int(bottom * ih), int(left * iw) : int(right * iw)]
+        crop_h = max(1, round(crop.shape[0] * QUALITY_FACE_WIDTH / crop.shape[1]))
+        crop = cv2.resize(crop, (QUALITY_FACE_WIDTH, crop_h), interpolation=cv2.INTER_AREA)
+        quality["sharpness"] = round(float(cv2.Laplacian(cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY), cv2.CV_64F).var()), 1)
+        if quality["sharpness"] < QUALITY_MIN_SHARPNESS:
+            raise QualityError("Image is too blurry, please hold the camera steady and retake the photo", "too_blurry", quality)
+
+    log_fields(quality=quality)
+    return quality
+
+
+def run_face_mesh(image, face_mesh, max_side=INFERENCE_MAX_SIDE):
+    with stage_timer("resize"):
+        inference_image = resize_for_inference(image, max_side)
+    with stage_timer("color"):
+        rgb_image = cv2.cvtColor(inference_image, cv2.COLOR_BGR2RGB)
+    with stage_timer("inference"):
+        results = face_mesh.process(rgb_image)
+    return inference_image, results
+
+
+def detect_landmarks(image, face_mesh, max_side=INFERENCE_MAX_SIDE, roi_refine=INFERENCE_ROI_REFINE):
+    inference_image, results = run_face_mesh(image, face_mesh, max_side)
+    points = extract_landmarks(results)
+    if roi_refine and inference_image is not image:
+        with stage_timer("roi_refine"):
+            points = refine_in_roi(image, points, face_mesh)
+    return points
+
+
+def compute_measurements(points, w, h, pixels_per_mm=None):
+    with stage_timer("geometry"):
+        faces = measure_faces(points, (w, h), pixels_per_mm=pixels_per_mm)
+        m = {name: values[0].item() for name, values in faces.items()}
+
+    log_fields(measurements=m)
+    return m
+
+
+ASSUMED_SCALE_MESSAGE = "These measurements were estimated using computer vision technology and an assumed scale. For confirmation, please consult a certified professional with proper measuring tools, ideally by using an image with a known reference object."
+CARD_SCALE_MESSAGE = "These measurements were estimated using computer vision technology, scaled by the reference card detected in the image. For confirmation, please consult a certified professional with proper measuring tools."
+
+
+def format_measurements(m):
+    return {
+        "Pupillary Distance (PD)": f"{m['pd_mm']:.1f} mm",
+        "Pupil Height (PH)": f"{m['pupil_height_mm']:.1f} mm",
+        "Naso-Pupillary Distance (NPD)": {
+            "Left Eye": f"{m['npd_left_mm']:.1f} mm",
+            "Right Eye": f"{m['npd_right_mm']:.1f} mm",
+        },
+        "Face Shape": m["face_shape"],
+        "Measurement Accuracy": f"{m['accuracy']}%",
+        "Detailed Measurements": {
+            "Face Length (mm)": round(m["face_length_mm"], 2),
+            "Cheekbone Width (mm)": round(m["cheekbone_width_mm"], 2),
+            "Jaw Width (mm)": round(m["jaw_width_mm"], 2),
+            "Forehead Width (mm)": round(m["forehead_width_mm"], 2),
+        },
+        "Scale Source": m.get("scale_source", face_geometry.SCALE_FROM_JAW),
+        "Message": CARD_SCALE_MESSAGE if m.get("scale_source") == face_geometry.SCALE_FROM_CARD else ASSUMED_SCALE_MESSAGE,
+    }
+
+
+def detect_reference_card(image, points, budget_ms=CARD_DETECTION_BUDGET_MS):
+    """Find a credit-card sized rectangle near the face.
+
+    Only a region around the face is searched, at reduced resolution, and the
+    search gives up once budget_ms is spent. Candidates are the regions
+    enclosed by luma and chroma edges, which keep a card held against the
+    face or hair apart from its surroundings even where their outlines touch,
+    then the closed outlines themselves, for cards whose print breaks up the
+    inside. Returns the card's long side in image pixels and its corners, or
+    None.
+    """
+    started = time.perf_counter()
+    deadline = started + budget_ms / 1000
+    h, w = image.shape[:2]
+    xs, ys = points[:, 0] * w, points[:, 1] * h
+    face_w, face_h = xs.max() - xs.min(), ys.max() - ys.min()
+    if face_w <= 0 or face_h <= 0:
+        return None
+
+    # Cards are held against the forehead, cheek or chin, so search one face size around it
+    x0, x1 = max(0, int(xs.min() - face_w)), min(w, int(xs.max() + face_w))
+    y0, y1 = max(0, int(ys.min() - face_h * 0.75)), min(h, int(ys.max() + face_h * 0.75))
+    roi = image[y0:y1, x0:x1]
+    scale = min(1.0, CARD_SEARCH_MAX_SIDE / max(roi.shape[:2]))
+    if scale < 1.0:
+        # INTER_LINEAR is an order of magnitude cheaper than INTER_AREA here; the blur below absorbs the aliasing
+        roi = cv2.resize(roi, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+
+    luma, cr, cb = cv2.split(cv2.cvtColor(cv2.GaussianBlur(roi, (5, 5), 0), cv2.COLOR_BGR2YCrCb))
+    # Every 4th pixel is plenty for the threshold and saves a full-image partition
+    median = float(np.median(luma[::4, ::4]))
+    edges = cv2.Canny(luma, int(0.33 * median), int(0.66 * median))
+    # A white or grey card against skin differs mostly in hue, a red one against lips or skin in both
+    for channel in (cr, cb):
+        edges |= cv2.Canny(channel, CARD_CHROMA_EDGES[0], CARD_CHROMA_EDGES[1])
+
+    # A card is 85.6 mm against a ~140 mm face, so roughly a third to a whole face width
+    face_w_roi = face_w * scale
+    min_side, max_side = face_w_roi * 0.3, face_w_roi * 1.1
+    card_aspect = CREDIT_CARD_WIDTH_MM / CREDIT_CARD_HEIGHT_MM
+    min_area = min_side * min_side / card_aspect * 0.8
+    max_area = max_side * max_side / card_aspect * 1.2
+
+    def enclosed_regions():
+        # Free space between edges, 4-connected so it cannot leak through a diagonal edge step;
+        # the region stops one edge pixel short of the card's border
+        count, labels, stats, _ = cv2.connectedComponentsWithStats(cv2.bitwise_not(edges), connectivity=4)
+        for label in range(1, count):
+            left, top, width, height, area = stats[label]
+            if not min_area <= area <= max_area or max(width, height) > max_side * 1.2:
+                continue
+            mask = (labels[top : top + height, left : left + width] == label).astype(np.uint8)
+            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=(left, top))
+            yield max(contours, key=cv2.contourArea), 0.5
+
+    def outlines():
+        # Close gaps in the outline without thickening it, which would shrink inner contours
+        for size in (3, 7):
+            closed = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, np.ones((size, size), np.uint8))
+            contours, _ = cv2.findContours(closed, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+            for contour in contours:
+                yield contour, 0.0
+
+    best = None
+    for candidates in (enclosed_regions, outlines):
+        if best is not None or time.perf_counter() > deadline:
+            break
+        for contour, grow in candidates():
+            if time.perf_counter() > deadline:
+                break
+            area = cv2.contourArea(contour)
+            if area < min_area:
+                continue
+            center, (side_a, side_b), angle = cv2.minAreaRect(contour)
+            side_a, side_b = side_a + 2 * grow, side_b + 2 * grow
+            long_side, short_side = max(side_a, side_b), min(side_a, side_b)
+            if short_side <= 0 or not min_side <= long_side <= max_side:
+                continue
+            aspect_error = abs(long_side / short_side - card_aspect) / card_aspect
+            if aspect_error > CARD_ASPECT_TOLERANCE:
+                continue
+            # How well the shape fills its bounding rectangle; rounded corners cost well under 1%
+            rectangularity = area / ((side_a - 2 * grow) * (side_b - 2 * grow))
+            score = rectangularity - aspect_error
+            if rectangularity <= CARD_MIN_RECTANGULARITY or (best is not None and score <= best[0]):
+                continue
+            rect = (center, (side_a, side_b), angle)
+            # A card cut off by the frame or the search region would be measured short
+            corners = cv2.boxPoints(rect)
+            if corners.min() < 1 or (corners[:, 0] > roi.shape[1] - 2).any() or (corners[:, 1] > roi.shape[0] - 2).any():
+                continue
+            best = (score, long_side, short_side, rect)
+
+    if best is None:
+        return None
+    score, long_side, short_side, rect = best
+    corners = cv2.boxPoints(rect) / scale + [x0, y0]
+    return {
+        "width_px": long_side / scale,
+        "height_px": short_side / scale,
+        "corners": corners.round(1).tolist(),
+        "score": round(float(score), 3),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+    }
+
+
+def detect_scale(image, points, original_size=None):
+    """Pixels per mm in original-image pixels from a reference card, or None."""
+    w = (original_size or (image.shape[1], image.shape[0]))[0]
+    with stage_timer("card_detection"):
+        card = detect_reference_card(image, points)
+    if card is None:
+        return None
+    log_fields(reference_card=card)
+    # Card width is in decoded-image pixels; measurements are in original pixels
+    return card["width_px"] * (w / image.shape[1]) / CREDIT_CARD_WIDTH_MM
+
+
+def detect_face(image, face_mesh, original_size=None, card_detection=CARD_DETECTION, **detect_options):
+    """Landmarks and the card scale (or None): everything before the geometry."""
+    points = detect_landmarks(image, face_mesh, **detect_options)
+    pixels_per_mm = detect_scale(image, points, original_size) if card_detection else None
+    return points, pixels_per_mm
+
+
+def measure_image(image, face_mesh, original_size=None, card_detection=CARD_DETECTION, **detect_options):
+    w, h = original_size or (image.shape[1], image.shape[0])
+    points, pixels_per_mm = detect_face(image, face_mesh, (w, h), card_detection, **detect_options)
+    return compute_measurements(points, w, h, pixels_per_mm)
+
+
+def face_confidences(points, boxes):
+    """BlazeFace score of the best box around each face's eyes, 0 where none matches."""
+    if not boxes:
+        return np.zeros(len(points))
+    eyes = (points[:, LEFT_PUPIL, :2] + points[:, RIGHT_PUPIL, :2]) / 2
+    scores = np.array([score for score, _ in boxes])
+    edges = np.array([box for _, box in boxes])
+    x, y = eyes[:, None, 0], eyes[:, None, 1]
+    inside = (x >= edges[:, 0]) & (x <= edges[:, 2]) & (y >= edges[:, 1]) & (y <= edges[:, 3])
+    return np.where(inside, scores, 0.0).max(axis=1)
+
+
+def measure_group(image, original_size, max_faces, encoding=None):
+    """Measure up to max_faces faces from one FaceMesh pass, ordered left to right.
+
+    FaceMesh reports no per-face score, so each face's confidence is the
+    BlazeFace score of the detection around its eyes. The quality gate
+    checks the most confident face; the geometry runs for all faces at once.
+    """
+    w, h = original_size
+    small = quality_image(image)
+    with get_face_detection_pool().checkout() as face_detection:
+        with stage_timer("face_detection"):
+            boxes = detect_face_boxes(small, face_detection)
+    quality = assess_quality(image, None, original_size, boxes=boxes) if QUALITY_GATE else None
+
+    with get_group_face_mesh_pool().checkout() as face_mesh:
+        points = extract_all_landmarks(run_face_mesh(image, face_mesh)[1])
+    confidence = face_confidences(points, boxes)
+    # The most confident faces when FaceMesh found more than asked for, then by position
+    keep = np.argsort(-confidence, kind="stable")[:max_faces]
+    keep = keep[np.argsort(points[keep, :, 0].mean(axis=1), kind="stable")]
+    points, confidence = points[keep], confidence[keep]
+
+    scales = [detect_scale(image, face, original_size) if CARD_DETECTION else None for face in points]
+    with stage_timer("geometry"):
+        faces = measure_faces(points, (w, h), pixels_per_mm=np.array([np.nan if s is None else s for s in scales]))
+
+    results = []
+    for index, face in enumerate(points):
+        measurements = {name: values[index].item() for name, values in faces.items()}
+        entry = format_measurements(measurements)
+        entry["Confidence"] = round(float(confidence[index]), 3)
+        entry["Face Box"] = [
+            round(float(face[:, 0].min() * w)),
+            round(float(face[:, 1].min() * h)),
+            round(float(face[:, 0].max() * w)),
+            round(float(face[:, 1].max() * h)),
+        ]
+        if encoding:
+            entry["measurements"] = measurements
+            entry["landmarks"] = export_landmarks(face, encoding, original_size, scales[index])
+        results.append(entry)
+    log_fields(faces=len(results), confidence=[entry["Confidence"] for entry in results])
+
+    result = {"Face Count": len(results), "Faces": results}
+    if quality is not None:
+        result["Image Quality"] = quality
+    return result
+
+
+def requested_faces():
+    # ?faces=N (2 to MAX_FACES) switches /process to group mode
+    try:
+        faces = int(request.args.get("faces", "1"))
+    except ValueError:
+        raise UploadError("faces must be an integer", reason="bad_request")
+    if not 1 <= faces <= MAX_FACES:
+        raise UploadError(f"faces must be between 1 and {MAX_FACES}", reason="bad_request")
+    return faces
+
+
+def landmark_encoding():
+    # ?landmarks=uint16|float16 (or 1 for uint16) opts in to the compact landmark export
+    value = request.args.get("landmarks", "").lower()
+    if value in ("", "0", "false"):
+        return None
+    if value in ("1", "true"):
+        return LANDMARK_ENCODINGS[0]
+    if value not in LANDMARK_ENCODINGS:
+        raise UploadError(f"landmarks must be one of {', '.join(LANDMARK_ENCODINGS)}", reason="bad_request")
+    return value
+
+
+def export_landmarks(points, encoding, original_size, pixels_per_mm):
+    """The packed landmarks plus what /process/landmarks needs to recompute from them."""
+    return {
+        "encoding": encoding,
+        "shape": list(points.shape),
+        "data": base64.b64encode(pack_landmarks(points, encoding)).decode("ascii"),
+        "image_size": list(original_size),
+        "pixels_per_mm": pixels_per_mm,
+    }
+
+
+TRACKED_FIELDS = ("pd_mm", "pupil_height_mm", "npd_left_mm", "npd_right_mm")
+SUMMARY_FIELDS = TRACKED_FIELDS + ("face_length_mm", "cheekbone_width_mm", "jaw_width_mm", "forehead_width_mm")
+
+
+def summarize_frames(points, sizes):
+    faces = measure_faces(np.stack(points), np.asarray(sizes))
+    summary = {}
+    for field in SUMMARY_FIELDS:
+        values = faces[field]
+        q1, median, q3 = np.percentile(values, [25, 50, 75])
+        summary[field] = {
+            "median": float(median),
+            "std": float(values.std()),
+            "iqr": float(q3 - q1),
+            # Standard error of the median for roughly normal noise
+            "stderr": float(1.2533 * values.std() / np.sqrt(len(values))),
+        }
+    return faces, summary
+
+
+def has_converged(summary):
+    return all(summary[field]["stderr"] <= FRAMES_CONVERGENCE_MM for field in TRACKED_FIELDS)
+
+
+def measure_frames(frames, deadline=None):
+    """Track a face across (image, original_size) frames and aggregate the measurements.
+
+    A frame whose image is None could not be decoded; it is counted and skipped.
+    """
+    points, sizes = [], []
+    received = missed = unreadable = 0
+    converged = False
+    summary = None
+    # Tracking state belongs to one clip, so each clip gets its own graph
+    with mediapipe_solutions().face_mesh.FaceMesh(**dict(FACE_MESH_OPTIONS, static_image_mode=False)) as face_mesh:
+        for image, original_size in frames:
+            check_deadline(deadline)
+            received += 1
+            if image is None:
+                unreadable += 1
+                continue
+            try:
+                points.append(detect_landmarks(image, face_mesh, roi_refine=False))
+                sizes.append(original_size)
+            except MeasurementError:
+                missed += 1
+                continue
+            if len(points) >= MIN_FRAMES:
+                summary = summarize_frames(points, sizes)[1]
+                if has_converged(summary):
+                    converged = True
+                    break
+            if received >= MAX_FRAMES:
+                break
+
+    if received == unreadable:
+        raise UploadError("Could not read any frames")
+    if not points:
+        raise MeasurementError("No face detected", reason="no_face")
+    with stage_timer("geometry"):
+        faces, summary = summarize_frames(points, sizes)
+    shapes, counts = np.unique(faces["face_shape"], return_counts=True)
+    median = {field: summary[field]["median"] for field in SUMMARY_FIELDS}
+    face_shape = face_geometry.classify_face_shapes(
+        median["face_length_mm"], median["cheekbone_width_mm"], median["jaw_width_mm"], median["forehead_width_mm"]
+    ).item()
+    return {
+        **median,
+        "face_shape": face_shape,
+        "accuracy": round(float(np.median(faces["accuracy"])), 2),
+        "frames": {
+            "received": received,
+            "measured": len(points),
+            "no_face": missed,
+            "unreadable": unreadable,
+            "converged": converged,
+        },
+        "face_shape_votes": {shape: int(count) for shape, count in zip(shapes, counts)},
+        "statistics": summary,
+    }
+
+
+def video_frames(path):
+    capture = cv2.VideoCapture(path)
+    try:
+        while True:
+            with stage_timer("decode"):
+                ok, frame = capture.read()
+            if not ok:
+                break
+            yield frame, (frame.shape[1], frame.shape[0])
+    finally:
+        capture.release()
+
+
+def uploaded_frames(files):
+    for file in files:
+        data = read_upload(file.stream)
+        try:
+            image, original_size = decode_image(data, INFERENCE_MAX_SIDE)
+        except UploadError as e:
+            # One corrupt frame should not cost the rest of the sequence; size limits still reject the request
+            if e.reason != "invalid_image":
+                raise
+            logger.warning("Skipping unreadable frame %s: %s", file.filename, e)
+            image = original_size = None
+        yield image, original_size
+
+
+_worker_face_mesh = None
+_worker_face_detection = None
+# Stage timings of the image a batch worker is measuring, sent back with its result
+_worker_stages = None
+
+
+def _init_batch_worker():
+    global _worker_face_mesh, _worker_face_detection
+    solutions = mediapipe_solutions()
+    _worker_face_mesh = solutions.face_mesh.FaceMesh(**FACE_MESH_OPTIONS)
+    _worker_face_detection = solutions.face_detection.FaceDetection(**FACE_DETECTION_OPTIONS)
+
+
+def _measure_in_worker(data):
+    # This process's own metrics are never scraped, so the parent records the stages
+    global _worker_stages
+    _worker_stages = []
+    return (*_measure_batch_image(data), _worker_stages)
+
+
+def _measure_batch_image(data):
+    try:
+        image, original_size = decode_image(data, decode_max_side())
+        quality = assess_quality(image, _worker_face_detection, original_size) if QUALITY_GATE else None
+        result = format_measurements(measure_image(image, _worker_face_mesh, original_size))
+        if quality is not None:
+            result["Image Quality"] = quality
+        return 200, result
+    except MeasurementError as e:
+        return e.status, error_payload(e)
+    except Exception as e:
+        logger.exception("Error while processing batch image")
+        return 500, {"error": str(e)}
+
+
+_batch_executor = None
+_batch_executor_lock = threading.Lock()
+
+
+def get_batch_executor():
+    global _batch_executor
+    if _batch_executor is None:
+        with _batch_executor_lock:
+            if _batch_executor is None:
+                # spawn keeps MediaPipe's threads from being forked mid-state
+                _batch_executor = ProcessPoolExecutor(
+                    max_workers=max(1, BATCH_WORKERS),
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_batch_worker,
+                )
+    return _batch_executor
+
+
+def discard_batch_executor(executor):
+    # A worker that died (segfault, OOM kill) breaks the whole pool; the next batch builds a new one
+    global _batch_executor
+    with _batch_executor_lock:
+        if _batch_executor is executor:
+            _batch_executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+@app.route("/process", methods=["POST"])
+def process_image():
+    if request.content_length and request.content_length > MAX_REQUEST_BYTES:
+        return jsonify({"error": f"Image exceeds {MAX_UPLOAD_BYTES} bytes"}), 413
+
+    try:
+        with stage_timer("receive"):
+            if request.mimetype in RAW_IMAGE_TYPES:
+                filename = request.headers.get(FILENAME_HEADER, "")
+                data = read_upload(request.stream)
+            else:
+                if "image" not in request.files:
+                    return jsonify({"error": "No image file provided"}), 400
+
+                file = request.files["image"]
+                if file.filename == "":
+                    return jsonify({"error": "Empty filename"}), 400
+
+                filename = file.filename
+                data = read_upload(file.stream)
+        log_fields(filename=filename, bytes=len(data))
+        if PERSIST_UPLOADS:
+            log_fields(persisted_as=persist_upload(data))
+        encoding = landmark_encoding()
+        max_faces = requested_faces()
+        variant = encoding or ""
+        if max_faces > 1:
+            variant += f"|faces={max_faces}/{MAX_FACES}"
+        cache_key = result_cache.key(data, variant)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            status, payload = cached
+            g.outcome = "cache_hit"
+            return jsonify(payload), status
+    except MeasurementError as e:
+        return error_response(e)
+    # Cache hits above are answered without a slot; only a miss queues for inference
+    return measure_upload(data, cache_key, encoding, max_faces)
+
+
+@admission_controlled
+def measure_upload(data, cache_key, encoding, max_faces, deadline=None):
+    try:
+        check_deadline(deadline)
+        image, original_size = decode_image(data, decode_max_side())
+    except MeasurementError as e:
+        return error_response(e)
+
+    try:
+        check_deadline(deadline)
+        if max_faces > 1:
+            result = measure_group(image, original_size, max_faces, encoding)
+            result_cache.put(cache_key, 200, result)
+            check_deadline(deadline)
+            with stage_timer("serialize"):
+                return jsonify(result)
+
+        quality = None
+        if QUALITY_GATE:
+            with get_face_detection_pool().checkout() as face_detection:
+                quality = assess_quality(image, face_detection, original_size)
+        with get_face_mesh_pool().checkout() as face_mesh:
+            points, pixels_per_mm = detect_face(image, face_mesh, original_size)
+        measurements = compute_measurements(points, *original_size, pixels_per_mm)
+        result = format_measurements(measurements)
+        if quality is not None:
+            result["Image Quality"] = quality
+        if encoding:
+            result["measurements"] = measurements
+            result["landmarks"] = export_landmarks(points, encoding, original_size, pixels_per_mm)
+        # Cached even past the deadline so the client's retry is served instantly
+        result_cache.put(cache_key, 200, result)
+        check_deadline(deadline)
+        with stage_timer("serialize"):
+            return jsonify(result)
+
+    except MeasurementError as e:
+        if e.status == 422:
+            result_cache.put(cache_key, e.status, error_payload(e))
+        return error_response(e)
+
+    except TimeoutError:
+        return error_response(Overloaded())
+
+    except Exception as e:
+        logger.exception("Error while processing image")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/process/landmarks", methods=["POST"])
+def measure_landmarks():
+    """Recompute measurements from exported landmarks without touching MediaPipe.
+
+    Takes the "landmarks" object of a /process?landmarks=... response as JSON,
+    or the packed bytes as application/octet-stream with encoding, width,
+    height and optionally pixels_per_mm as query parameters.
+    """
+    try:
+        if request.mimetype == "application/octet-stream":
+            exported = dict(request.args, image_size=[request.args.get("width"), request.args.get("height")])
+            data = request.get_data()
+        else:
+            body = request.get_json(silent=True) or {}
+            if not isinstance(body, dict):
+                raise UploadError("Body must be a JSON object", reason="bad_request")
+            exported = body.get("landmarks", body)
+            if not isinstance(exported, dict):
+                raise UploadError("landmarks must be a JSON object", reason="bad_request")
+            try:
+                data = base64.b64decode(exported["data"], validate=True)
+            except (KeyError, TypeError, ValueError):
+                raise UploadError("landmarks.data must be base64", reason="bad_request")
+        try:
+            w, h = (int(v) for v in exported["image_size"])
+            pixels_per_mm = exported.get("pixels_per_mm")
+            pixels_per_mm = None if pixels_per_mm in (None, "") else float(pixels_per_mm)
+            points = unpack_landmarks(data, exported.get("encoding", LANDMARK_ENCODINGS[0]))
+        except (KeyError, TypeError, ValueError) as e:
+            raise UploadError(f"Invalid landmarks: {e}", reason="bad_request")
+        if w <= 0 or h <= 0:
+            raise UploadError("image_size must be positive", reason="bad_request")
+    except MeasurementError as e:
+        return error_response(e)
+
+    measurements = compute_measurements(points, w, h, pixels_per_mm)
+    result = format_measurements(measurements)
+    result["measurements"] = measurements
+    return jsonify(result)
+
+
+@app.route("/process/batch", methods=["POST"])
+@admission_controlled
+def process_batch(deadline=None):
+    files = request.files.getlist("images")
+    if not files:
+        return jsonify({"error": "No image files provided"}), 400
+    if len(files) > MAX_BATCH_IMAGES:
+        return jsonify({"error": f"At most {MAX_BATCH_IMAGES} images per batch"}), 400
+
+    results = [None] * len(files)
+    pending = []
+    for index, file in enumerate(files):
+        try:
+            if file.filename == "":
+                raise UploadError("Empty filename")
+            data = read_upload(file.stream)
+            if PERSIST_UPLOADS:
+                persist_upload(data)
+            cache_key = result_cache.key(data)
+            cached = result_cache.get(cache_key)
+            if cached is not None:
+                results[index] = cached
+            else:
+                pending.append((index, cache_key, data))
+        except UploadError as e:
+            results[index] = (e.status, {"error": str(e)})
+
+    log_fields(images=len(files), queued=len(pending))
+    if pending:
+        executor = get_batch_executor()
+        broken = False
+        futures = []
+        for index, cache_key, data in pending:
+            try:
+                future = executor.submit(_measure_in_worker, data)
+            except BrokenProcessPool:
+                future = None
+            futures.append((index, cache_key, future))
+        for index, cache_key, future in futures:
+            try:
+                if future is None:
+                    raise BrokenProcessPool()
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                status, payload, stages = future.result(timeout=timeout)
+            except FutureTimeoutError:
+                future.cancel()
+                results[index] = (504, {"error": str(DeadlineExceeded())})
+                continue
+            except BrokenProcessPool:
+                broken = True
+                results[index] = (503, {"error": "Batch worker stopped unexpectedly, please retry", "reason": "worker_crashed"})
+                continue
+            results[index] = (status, payload)
+            for stage, elapsed in stages:
+                metrics.observe("measure_stage_seconds", elapsed, stage=stage)
+            # Upload errors are cheap to recompute and 5xx may be transient
+            if status == 200 or status == 422:
+                result_cache.put(cache_key, status, payload)
+        if broken:
+            logger.error("Batch worker pool broke; it is rebuilt for the next batch")
+            discard_batch_executor(executor)
+
+    items = []
+    for index, (file, (status, payload)) in enumerate(zip(files, results)):
+        item = {"index": index, "filename": file.filename, "status": status}
+        if status == 200:
+            item["data"] = payload
+        else:
+            item.update(payload)
+        items.append(item)
+    return jsonify({"results": items})
+
+
+@app.route("/process/frames", methods=["POST"])
+@admission_controlled
+def process_frames(deadline=None):
+    video = request.files.get("video")
+    files = request.files.getlist("frames")
+    if video is None and not files:
+        return jsonify({"error": "Provide a video file or a sequence of frames"}), 400
+
+    temp_path = None
+    try:
+        if video is not None:
+            data = read_upload(video.stream, MAX_VIDEO_BYTES)
+            log_fields(filename=video.filename, bytes=len(data))
+            # OpenCV's video readers need a path
+            with tempfile.NamedTemporaryFile(suffix=os.path.splitext(video.filename)[1] or ".mp4", delete=False) as f:
+                f.write(data)
+                temp_path = f.name
+            frames = video_frames(temp_path)
+        else:
+            log_fields(frames=len(files))
+            frames = uploaded_frames(files[:MAX_FRAMES])
+
+        result = measure_frames(frames, deadline)
+        log_fields(measurements=result)
+
+        with stage_timer("serialize"):
+            response = format_measurements(result)
+            response["Frames"] = result["frames"]
+            response["Face Shape Votes"] = result["face_shape_votes"]
+            response["Statistics (mm)"] = {
+                field: {key: round(value, 2) for key, value in stats.items()}
+                for field, stats in result["statistics"].items()
+            }
+            return jsonify(response)
+
+    except MeasurementError as e:
+        return error_response(e)
+
+    except Exception as e:
+        logger.exception("Error while processing frames")
         return jsonify({"error": str(e)}), 500
 
     finally:
-        if os.path.exists(temp_filename):
-            os.remove(temp_filename)
-            print(f"Temporary file deleted: {temp_filename}")
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+@app.before_request
+def start_request_timing():
+    g.started = time.perf_counter()
+    g.stages = {}
+    g.log_fields = {}
+    # Set before any view touches the body, so a chunked upload is cut off at the route's limit
+    if request.endpoint in ROUTE_MAX_CONTENT_LENGTH:
+        request.max_content_length = ROUTE_MAX_CONTENT_LENGTH[request.endpoint]
+
+
+DEFAULT_OUTCOMES = {200: "ok", 400: "bad_request", 413: "too_large", 500: "internal_error"}
+
+
+@app.after_request
+def record_request(response):
+    elapsed = time.perf_counter() - g.get("started", time.perf_counter())
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    status = response.status_code
+    outcome = g.get("outcome") or DEFAULT_OUTCOMES.get(status, "other")
+    metrics.inc("measure_requests_total", endpoint=endpoint, status=status, outcome=outcome)
+    metrics.observe("measure_request_seconds", elapsed, endpoint=endpoint)
+    if metrics.directory:
+        metrics.flush_soon()
+
+    # Readiness probes polling during startup are expected 503s, not failures worth a warning
+    failed = status >= 500 and outcome != "not_ready"
+    if failed or (REQUEST_LOG_SAMPLE_RATE > 0 and random.random() < REQUEST_LOG_SAMPLE_RATE):
+        record = {
+            "endpoint": endpoint,
+            "status": status,
+            "outcome": outcome,
+            "duration_ms": round(elapsed * 1000, 3),
+            "stages_ms": g.get("stages", {}),
+            **g.get("log_fields", {}),
+        }
+        logger.log(logging.WARNING if failed else logging.INFO, json.dumps(record, default=str))
+    return response
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    gauges = {}
+    # Pools are read only once built, so a scrape never loads MediaPipe itself
+    pools = [
+        (prefix, pool.stats())
+        for prefix, pool in (
+            ("measure_pool", _face_mesh_pool),
+            ("measure_detection_pool", _face_detection_pool),
+            ("measure_group_pool", _group_face_mesh_pool),
+        )
+        if pool is not None
+    ]
+    for prefix, stats in (
+        ("measure_startup", lifecycle.gauges()),
+        *pools,
+        ("measure_admission", admission.stats()),
+        ("measure_cache", result_cache.stats()),
+        ("measure_plate_cache", plate_cache.stats()),
+    ):
+        for name, value in stats.items():
+            gauges[f"{prefix}_{name}"] = value
+    return app.response_class(metrics.render(gauges), mimetype="text/plain; version=0.0.4")
+
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    return jsonify({"error": "Upload too large"}), 413
 
 
 @app.route("/ping", methods=["GET"])
@@ -223,5 +2014,69 @@ def ping():
     return jsonify({"message": "Flask server is running!"})
 
 
+@app.route("/ready", methods=["GET"])
+def ready():
+    # Unlike /ping, 503 until the models are loaded and have run a first inference
+    stats = lifecycle.stats()
+    if _face_mesh_pool is not None:
+        stats["pool"] = _face_mesh_pool.stats()
+    stats["plate_cache_entries"] = plate_cache.stats()["entries"]
+    if not lifecycle.ready:
+        g.outcome = "not_ready"
+        return jsonify(stats), 503
+    return jsonify(stats)
+
+
+@app.route("/pool", methods=["GET"])
+def pool_stats():
+    # Like /ready, report the pools without building them before warm-up does
+    stats = _face_mesh_pool.stats() if _face_mesh_pool is not None else {"size": FACE_MESH_POOL_SIZE, "loaded": False}
+    if _face_detection_pool is not None:
+        stats["face_detection"] = _face_detection_pool.stats()
+    if _group_face_mesh_pool is not None:
+        stats["group"] = _group_face_mesh_pool.stats()
+    return jsonify(stats)
+
+
+@app.route("/admission", methods=["GET"])
+def admission_stats():
+    return jsonify(admission.stats())
+
+
+@app.route("/cache", methods=["GET"])
+def cache_stats():
+    return jsonify(result_cache.stats())
+
+
+@app.route("/plates/<name>", methods=["GET"])
+def plate_image(name):
+    fmt = request.args.get("format", "webp").lower()
+    width = request.args.get("width", PLATE_DEFAULT_WIDTH, type=int)
+    if name not in plate_cache.names:
+        return jsonify({"error": "Unknown plate"}), 404
+    if fmt not in PLATE_FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(PLATE_FORMATS)}"}), 400
+    # Snap up to the ladder so arbitrary widths cannot each force a render
+    width = next((step for step in PLATE_WIDTHS if step >= width), PLATE_WIDTHS[-1])
+
+    data, etag = plate_cache.get(name, width, fmt)
+    response = app.response_class(data, mimetype=PLATE_FORMATS[fmt][0])
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = PLATE_MAX_AGE
+    return response.make_conditional(request)
+
+
+# Importing this module only defines the app; the models are loaded by
+# start_warm_up(), called from __main__ below or gunicorn's post_worker_init,
+# so CLI tools and spawned batch workers that import it stay light.
+lifecycle.mark("import_ms", _import_started)
+
+
 if __name__ == "__main__":
-    app.run(port=6006, debug=True)
+    start_warm_up()
+    # Development server; production runs under gunicorn (see gunicorn.conf.py).
+    # MEASURE_SOCKET=/path/to/measure.sock serves on a Unix socket instead of TCP.
+    socket_path = os.environ.get("MEASURE_SOCKET", "")
+    host = f"unix://{socket_path}" if socket_path else "127.0.0.1"
+    app.run(host=host, port=6006, debug=os.environ.get("FLASK_DEBUG", "0") == "1", threaded=True)
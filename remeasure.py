@@ -0,0 +1,300 @@
+"""Re-measure stored face images offline, e.g. after tuning thresholds.
+
+Images from a directory (searched recursively) or a manifest (one path per
+line, relative to the manifest) go through the same pipeline as /process:
+quality gate, FaceMesh, reference card and face geometry. The pipeline runs
+in a pool of worker processes that each keep their models warm. Results are
+appended to a JSONL or CSV file (picked by extension) as they finish, and a
+rerun skips every path already in the output, so an interrupted run resumes
+where it stopped. Paths that failed with a server error or could not be read
+are retried; the later row for a path supersedes the earlier one.
+
+Landmarks, the detected card scale and the quality verdict are kept in an
+SQLite landmark cache keyed by path, size and modification time. A rerun
+that only changes the geometry settings (--jaw-width-mm, --tight, --moderate,
+--significant) is served from that cache without running FaceMesh.
+
+    python remeasure.py uploads/ --out remeasured.jsonl
+    python remeasure.py --manifest records.txt --out remeasured.csv --workers 8
+    python remeasure.py uploads/ --out shapes_v2.jsonl --tight 0.08 --significant 0.22
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+import face_geometry
+from face_geometry import measure_faces
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".jfif", ".png", ".webp")
+GEOMETRY_BATCH = 1024
+MEASURED_FIELDS = [
+    "pd",
+    "pupil_height",
+    "npd_left",
+    "npd_right",
+    "jaw_width",
+    "cheekbone_width",
+    "forehead_width",
+    "face_length",
+]
+QUALITY_FIELDS = ["brightness", "face_brightness", "face_width_px", "sharpness", "detection_score"]
+OUTPUT_FIELDS = (
+    ["path", "status", "reason", "error", "face_shape", "accuracy", "scale_source", "pixels_per_mm"]
+    + [f"{name}_mm" for name in MEASURED_FIELDS]
+    + [f"{name}_pixel" for name in MEASURED_FIELDS]
+    + [f"quality_{name}" for name in QUALITY_FIELDS]
+)
+
+
+def iter_images(directory=None, manifest=None):
+    if manifest:
+        base = os.path.dirname(os.path.abspath(manifest))
+        with open(manifest) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    yield os.path.normpath(os.path.join(base, line))
+        return
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(root, name)
+
+
+class LandmarkCache:
+    """Per-image inference results, valid while the file and inference settings are unchanged."""
+
+    def __init__(self, db_path, settings):
+        self.settings = json.dumps(settings, sort_keys=True)
+        self._db = sqlite3.connect(db_path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS landmarks (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER,"
+            " settings TEXT, record TEXT, points BLOB)"
+        )
+
+    def get(self, path, stat):
+        row = self._db.execute(
+            "SELECT record, points FROM landmarks WHERE path = ? AND size = ? AND mtime_ns = ? AND settings = ?",
+            (path, stat.st_size, stat.st_mtime_ns, self.settings),
+        ).fetchone()
+        if row is None:
+            return None
+        record = json.loads(row[0])
+        if row[1] is not None:
+            record["points"] = np.frombuffer(row[1], dtype=np.float64).reshape(-1, 3)
+        return record
+
+    def put(self, path, stat, record):
+        points = record.get("points")
+        stored = {key: value for key, value in record.items() if key != "points"}
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO landmarks VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    path,
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                    self.settings,
+                    json.dumps(stored),
+                    None if points is None else np.ascontiguousarray(points, dtype=np.float64).tobytes(),
+                ),
+            )
+
+    def close(self):
+        self._db.close()
+
+
+def _init_worker():
+    import process_server
+
+    process_server._init_batch_worker()
+
+
+def infer(path):
+    """Everything up to the geometry for one image, run in a worker process."""
+    import process_server as ps
+
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        image, original_size = ps.decode_image(data, ps.decode_max_side())
+        record = {"status": 200, "size": list(original_size)}
+        if ps.QUALITY_GATE:
+            record["quality"] = ps.assess_quality(image, ps._worker_face_detection, original_size)
+        record["points"], record["pixels_per_mm"] = ps.detect_face(image, ps._worker_face_mesh, original_size)
+    except ps.MeasurementError as e:
+        record = {"status": e.status, "error": str(e), "reason": e.reason, "quality": getattr(e, "quality", None)}
+    except Exception as e:
+        record = {"status": 500, "error": str(e), "reason": "internal_error"}
+    return path, record
+
+
+def measure_records(records, jaw_width_mm, shape_thresholds):
+    """Output rows for (path, record) pairs, running the geometry for all measured faces at once."""
+    measured = [(path, record) for path, record in records if record["status"] == 200]
+    if measured:
+        faces = measure_faces(
+            np.stack([record["points"] for _, record in measured]),
+            np.array([record["size"] for _, record in measured], dtype=np.float64),
+            jaw_width_mm=jaw_width_mm,
+            pixels_per_mm=np.array(
+                [np.nan if record["pixels_per_mm"] is None else record["pixels_per_mm"] for _, record in measured]
+            ),
+            **shape_thresholds,
+        )
+    rows = []
+    index = 0
+    for path, record in records:
+        row = {"path": path, "status": record["status"], "reason": record.get("reason"), "error": record.get("error")}
+        if record["status"] == 200:
+            row.update({name: values[index].item() for name, values in faces.items()})
+            index += 1
+        for name, value in (record.get("quality") or {}).items():
+            row[f"quality_{name}"] = value
+        rows.append(row)
+    return rows
+
+
+class ResultWriter:
+    """Appends rows to JSONL or CSV, flushing each one so an interrupted run loses nothing written."""
+
+    def __init__(self, path, restart=False):
+        self.path = path
+        self.csv = path.lower().endswith(".csv")
+        exists = not restart and os.path.exists(path) and os.path.getsize(path) > 0
+        if exists:
+            # Before reading, so a half-written CSV row is not taken as done
+            self._drop_partial_line()
+        self.done = set() if restart else self._read_done()
+        self._file = open(path, "a" if exists else "w", newline="")
+        if self.csv:
+            self._writer = csv.DictWriter(self._file, fieldnames=OUTPUT_FIELDS, extrasaction="ignore")
+            if not exists:
+                self._writer.writeheader()
+
+    @staticmethod
+    def _is_final(row):
+        # 5xx rows (worker errors) and unreadable files may succeed on a rerun
+        try:
+            status = int(row.get("status") or 0)
+        except ValueError:
+            return False
+        return status < 500 and row.get("reason") != "unreadable"
+
+    def _read_done(self):
+        if not os.path.exists(self.path):
+            return set()
+        with open(self.path, newline="") as f:
+            if self.csv:
+                rows = csv.DictReader(f)
+            else:
+                rows = []
+                for line in f:
+                    try:
+                        rows.append(json.loads(line))
+                    except ValueError:
+                        continue  # Half-written last line of an interrupted run
+            return {row["path"] for row in rows if row.get("path") and self._is_final(row)}
+
+    def _drop_partial_line(self):
+        with open(self.path, "rb+") as f:
+            data = f.read()
+            if not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+
+    def write(self, row):
+        if self.csv:
+            self._writer.writerow(row)
+        else:
+            self._file.write(json.dumps(row) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("images", nargs="?", help="Directory of images, searched recursively")
+    parser.add_argument("--manifest", help="File listing one image path per line instead of a directory")
+    parser.add_argument("--out", required=True, help="Results file, .jsonl or .csv")
+    parser.add_argument("--restart", action="store_true", help="Overwrite --out instead of resuming it")
+    parser.add_argument("--landmark-cache", default="remeasure_landmarks.db")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--jaw-width-mm", type=float, default=face_geometry.ASSUMED_JAW_WIDTH_MM)
+    parser.add_argument("--tight", type=float, default=face_geometry.TIGHT_SIMILARITY)
+    parser.add_argument("--moderate", type=float, default=face_geometry.MODERATE_SIMILARITY)
+    parser.add_argument("--significant", type=float, default=face_geometry.SIGNIFICANT_DIFFERENCE)
+    args = parser.parse_args()
+    if bool(args.images) == bool(args.manifest):
+        parser.error("give either an image directory or --manifest")
+
+    from process_server import INFERENCE_SETTINGS
+
+    shape_thresholds = {"tight": args.tight, "moderate": args.moderate, "significant": args.significant}
+    cache = LandmarkCache(args.landmark_cache, INFERENCE_SETTINGS)
+    writer = ResultWriter(args.out, args.restart)
+    started = time.perf_counter()
+    counts = {"skipped": 0, "cached": 0, "inferred": 0}
+
+    def emit(records):
+        for row in measure_records(records, args.jaw_width_mm, shape_thresholds):
+            writer.write(row)
+
+    # Cache hits are measured in vectorized batches straight away; misses are queued for the workers
+    misses, hits = [], []
+    for path in iter_images(args.images, args.manifest):
+        if path in writer.done:
+            counts["skipped"] += 1
+            continue
+        try:
+            record = cache.get(path, os.stat(path))
+        except OSError as e:
+            emit([(path, {"status": 400, "error": str(e), "reason": "unreadable"})])
+            continue
+        if record is None:
+            misses.append(path)
+            continue
+        hits.append((path, record))
+        counts["cached"] += 1
+        if len(hits) >= GEOMETRY_BATCH:
+            emit(hits)
+            hits = []
+    emit(hits)
+    print(f"{counts['skipped']} already done, {counts['cached']} from the landmark cache, {len(misses)} to infer")
+
+    if misses:
+        # spawn keeps MediaPipe's threads from being forked mid-state
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(max(1, args.workers), initializer=_init_worker) as pool:
+            try:
+                for path, record in pool.imap_unordered(infer, misses):
+                    if record["status"] != 500:
+                        cache.put(path, os.stat(path), record)
+                    emit([(path, record)])
+                    counts["inferred"] += 1
+                    if counts["inferred"] % 100 == 0:
+                        rate = counts["inferred"] / (time.perf_counter() - started)
+                        print(f"{counts['inferred']}/{len(misses)} inferred, {rate:.1f} images/s", file=sys.stderr)
+            except KeyboardInterrupt:
+                pool.terminate()
+                print("Interrupted; rerun the same command to resume", file=sys.stderr)
+
+    writer.close()
+    cache.close()
+    elapsed = time.perf_counter() - started
+    print(f"Done in {elapsed:.1f} s: {counts['cached']} from cache, {counts['inferred']} inferred")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Report how much measurement accuracy each inference size costs.
+
+Every image is measured once at full resolution and once per target size
+(longest side fed to FaceMesh). The table shows the mean and worst absolute
+difference against full resolution, and how often the face shape changes.
+
+    python scale_accuracy_report.py path/to/faces --sizes 640 960 1280 --json report.json
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+from process_server import (
+    FACE_MESH_OPTIONS,
+    MeasurementError,
+    compute_measurements,
+    decode_image,
+    detect_landmarks,
+    mediapipe_solutions,
+)
+
+COMPARED_FIELDS = [
+    "pd_mm",
+    "pupil_height_mm",
+    "npd_left_mm",
+    "npd_right_mm",
+    "face_length_mm",
+    "cheekbone_width_mm",
+    "jaw_width_mm",
+    "forehead_width_mm",
+]
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".jfif", ".png", ".webp")
+
+
+def measure(path, face_mesh, max_side, roi_refine):
+    with open(path, "rb") as f:
+        data = f.read()
+    # Always decode at full size so only the inference resolution varies
+    image, (w, h) = decode_image(data)
+    points = detect_landmarks(image, face_mesh, max_side=max_side, roi_refine=roi_refine)
+    return compute_measurements(points, w, h), points * [w, h, w]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("images", help="Directory of face images")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[480, 640, 960, 1280, 1920])
+    parser.add_argument("--roi-refine", action="store_true", help="Also run the face ROI second pass")
+    parser.add_argument("--json", help="Write the full report to this file")
+    args = parser.parse_args()
+
+    paths = sorted(
+        os.path.join(args.images, name)
+        for name in os.listdir(args.images)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    report = {
+        size: {"errors": {field: [] for field in COMPARED_FIELDS}, "landmark_px": [], "shape_changes": 0, "failures": 0}
+        for size in args.sizes
+    }
+    measured = 0
+
+    with mediapipe_solutions().face_mesh.FaceMesh(**FACE_MESH_OPTIONS) as face_mesh:
+        for path in paths:
+            try:
+                baseline, baseline_points = measure(path, face_mesh, 0, False)
+            except MeasurementError as e:
+                print(f"Skipping {path}: {e}")
+                continue
+            measured += 1
+            for size in args.sizes:
+                entry = report[size]
+                try:
+                    result, points = measure(path, face_mesh, size, args.roi_refine)
+                except MeasurementError:
+                    entry["failures"] += 1
+                    continue
+                for field in COMPARED_FIELDS:
+                    entry["errors"][field].append(abs(result[field] - baseline[field]))
+                entry["landmark_px"].append(float(np.linalg.norm((points - baseline_points)[:, :2], axis=1).mean()))
+                entry["shape_changes"] += result["face_shape"] != baseline["face_shape"]
+
+    print(f"Images measured at full resolution: {measured}")
+    print(f"{'size':>6} {'field':<20} {'mean |err|':>11} {'max |err|':>10}")
+    summary = {}
+    for size in args.sizes:
+        entry = report[size]
+        summary[size] = {
+            "failures": entry["failures"],
+            "shape_changes": entry["shape_changes"],
+            "mean_landmark_shift_px": float(np.mean(entry["landmark_px"])) if entry["landmark_px"] else None,
+            "fields": {},
+        }
+        for field in COMPARED_FIELDS:
+            errors = entry["errors"][field]
+            if not errors:
+                continue
+            mean_err, max_err = float(np.mean(errors)), float(np.max(errors))
+            summary[size]["fields"][field] = {"mean_abs_mm": mean_err, "max_abs_mm": max_err}
+            print(f"{size:>6} {field:<20} {mean_err:>11.3f} {max_err:>10.3f}")
+        print(
+            f"{size:>6} face shape changed on {entry['shape_changes']} image(s), "
+            f"{entry['failures']} detection failure(s), "
+            f"mean landmark shift {summary[size]['mean_landmark_shift_px']} px"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"images": measured, "roi_refine": args.roi_refine, "sizes": summary}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
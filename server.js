@@ -9,6 +9,7 @@ import adminRoutes from "./routes/adminRoutes.js";
 import swaggerUi from "swagger-ui-express";
 import swaggerSpec from "./swagger/swaggerConfig.js";
 import { expireOldPurchases } from "./cron/expirePurchases.js";
+import { getColorPlate } from "./controllers/visualAcuityController.js";
 
 dotenv.config();
 const app = express();
@@ -21,6 +22,8 @@ expireOldPurchases();
 const __dirname = path.resolve();
 app.use("/uploads", express.static(path.join(__dirname, "uploads")));
 app.use("/ColorTestImages", express.static(path.join(__dirname, "ColorTestImages")));
+// Same plates as bitmaps at a requested width, rendered and cached by process_server.py
+app.get("/ColorTestPlates/:name", getColorPlate);
 
 // Initialize Firebase
 // const serviceAccount = path.join(__dirname, "perfect-jodi-firebase.json");
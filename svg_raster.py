@@ -0,0 +1,258 @@
+"""Rasterize the colour-vision plate SVGs with OpenCV.
+
+Covers the subset the plates in ColorTestImages use: <path> elements whose
+fill comes from a fill attribute, a style attribute or a simple class rule in
+<style>, with move, line, cubic/quadratic Bezier and arc commands. Curves are
+flattened once at parse time; each render only scales the polygons and fills
+them with anti-aliasing on an opaque white background.
+"""
+import math
+import re
+
+import cv2
+import numpy as np
+
+_STYLE = re.compile(r"<style\b[^>]*>(.*?)</style>", re.S)
+_ELEMENT = re.compile(r"<(path|svg)\b([^>]*)>", re.S)
+_ATTR = re.compile(r"([\w:-]+)\s*=\s*\"([^\"]*)\"")
+_CSS_RULE = re.compile(r"([^{}]+)\{([^}]*)\}")
+_NUMBER = re.compile(r"[-+]?(?:\d*\.\d+|\d+\.?)(?:[eE][-+]?\d+)?")
+_SEPARATORS = " \t\r\n,"
+
+# Segments per full turn of an arc and per Bezier curve when flattening
+ARC_SEGMENTS = 48
+CURVE_SEGMENTS = 8
+# Fixed-point bits for cv2.fillPoly, so edges land on sub-pixel positions
+SHIFT = 4
+
+
+class PathScanner:
+    """Tokenizer for path data, which may omit separators ("4.37.5", "0 11-8.2")."""
+
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def _skip(self):
+        while self.pos < len(self.data) and self.data[self.pos] in _SEPARATORS:
+            self.pos += 1
+
+    def command(self):
+        self._skip()
+        if self.pos < len(self.data) and self.data[self.pos].isalpha():
+            self.pos += 1
+            return self.data[self.pos - 1]
+        return None
+
+    def has_number(self):
+        self._skip()
+        return self.pos < len(self.data) and not self.data[self.pos].isalpha()
+
+    def number(self):
+        self._skip()
+        match = _NUMBER.match(self.data, self.pos)
+        if not match:
+            raise ValueError(f"Bad path data at {self.pos}: {self.data[self.pos:self.pos + 20]!r}")
+        self.pos = match.end()
+        return float(match.group())
+
+    def flag(self):
+        # Arc flags are single digits and are often written without separators
+        self._skip()
+        value = self.data[self.pos]
+        if value not in "01":
+            raise ValueError(f"Bad arc flag at {self.pos}")
+        self.pos += 1
+        return value == "1"
+
+
+def _cubic(p0, p1, p2, p3):
+    t = np.linspace(0, 1, CURVE_SEGMENTS + 1)[1:, None]
+    return (1 - t) ** 3 * p0 + 3 * (1 - t) ** 2 * t * p1 + 3 * (1 - t) * t**2 * p2 + t**3 * p3
+
+
+def _arc(p0, rx, ry, rotation, large_arc, sweep, p1):
+    """Endpoint-parameterized elliptical arc as points after p0 (SVG implementation notes F.6.5)."""
+    rx, ry = abs(rx), abs(ry)
+    if rx == 0 or ry == 0 or np.allclose(p0, p1):
+        return p1[None]
+    phi = math.radians(rotation)
+    cos_phi, sin_phi = math.cos(phi), math.sin(phi)
+    dx, dy = (p0 - p1) / 2
+    x1 = cos_phi * dx + sin_phi * dy
+    y1 = -sin_phi * dx + cos_phi * dy
+    # Scale up radii that are too small to reach the end point
+    radii_check = x1**2 / rx**2 + y1**2 / ry**2
+    if radii_check > 1:
+        rx, ry = rx * math.sqrt(radii_check), ry * math.sqrt(radii_check)
+    numerator = rx**2 * ry**2 - rx**2 * y1**2 - ry**2 * x1**2
+    factor = math.sqrt(max(0.0, numerator / (rx**2 * y1**2 + ry**2 * x1**2)))
+    if large_arc == sweep:
+        factor = -factor
+    cx1, cy1 = factor * rx * y1 / ry, -factor * ry * x1 / rx
+    cx = cos_phi * cx1 - sin_phi * cy1 + (p0[0] + p1[0]) / 2
+    cy = sin_phi * cx1 + cos_phi * cy1 + (p0[1] + p1[1]) / 2
+
+    start = math.atan2((y1 - cy1) / ry, (x1 - cx1) / rx)
+    end = math.atan2((-y1 - cy1) / ry, (-x1 - cx1) / rx)
+    delta = end - start
+    if sweep and delta < 0:
+        delta += 2 * math.pi
+    elif not sweep and delta > 0:
+        delta -= 2 * math.pi
+    steps = max(2, math.ceil(abs(delta) / (2 * math.pi) * ARC_SEGMENTS))
+    theta = start + delta * np.linspace(0, 1, steps + 1)[1:]
+    x = rx * np.cos(theta)
+    y = ry * np.sin(theta)
+    return np.stack([cos_phi * x - sin_phi * y + cx, sin_phi * x + cos_phi * y + cy], axis=1)
+
+
+def flatten_path(data):
+    """Polygons (one (N, 2) array per subpath) for SVG path data."""
+    scanner = PathScanner(data)
+    polygons, points = [], []
+    current = start = np.zeros(2)
+    last_control = None
+    command = None
+
+    def close():
+        if len(points) > 2:
+            polygons.append(np.vstack(points))
+        points.clear()
+
+    while True:
+        next_command = scanner.command()
+        if next_command is not None:
+            command = next_command
+        elif not scanner.has_number():
+            break
+        elif command is None:
+            raise ValueError("Path data must start with a command")
+        relative = command.islower()
+        origin = current if relative else np.zeros(2)
+        kind = command.upper()
+        control = None
+
+        if kind == "Z":
+            close()
+            current = start
+            if next_command is None:
+                break
+            continue
+        if kind != "M" and not points:
+            # Drawing straight after a close starts from the closed subpath's start point
+            points.append(current[None])
+        if kind == "M":
+            close()
+            current = start = origin + [scanner.number(), scanner.number()]
+            points.append(current[None])
+            # Further coordinate pairs after a move are implicit line-tos
+            command = "l" if relative else "L"
+        elif kind == "L":
+            current = origin + [scanner.number(), scanner.number()]
+            points.append(current[None])
+        elif kind == "H":
+            current = np.array([scanner.number() + (current[0] if relative else 0), current[1]])
+            points.append(current[None])
+        elif kind == "V":
+            current = np.array([current[0], scanner.number() + (current[1] if relative else 0)])
+            points.append(current[None])
+        elif kind in "CS":
+            if kind == "C":
+                c1 = origin + [scanner.number(), scanner.number()]
+            else:
+                c1 = 2 * current - last_control if last_control is not None else current
+            c2 = origin + [scanner.number(), scanner.number()]
+            end = origin + [scanner.number(), scanner.number()]
+            points.append(_cubic(current, c1, c2, end))
+            current, control = end, c2
+        elif kind == "Q":
+            q = origin + [scanner.number(), scanner.number()]
+            end = origin + [scanner.number(), scanner.number()]
+            points.append(_cubic(current, current + 2 / 3 * (q - current), end + 2 / 3 * (q - end), end))
+            current = end
+        elif kind == "A":
+            rx, ry, rotation = scanner.number(), scanner.number(), scanner.number()
+            large_arc, sweep = scanner.flag(), scanner.flag()
+            end = origin + [scanner.number(), scanner.number()]
+            points.append(_arc(current, rx, ry, rotation, large_arc, sweep, end))
+            current = end
+        else:
+            raise ValueError(f"Unsupported path command: {command}")
+        last_control = control
+    close()
+    return polygons
+
+
+def _parse_color(value):
+    value = value.strip()
+    if value.startswith("#") and len(value) == 4:
+        value = "#" + "".join(c * 2 for c in value[1:])
+    if not re.fullmatch(r"#[0-9a-fA-F]{6}", value):
+        return None
+    r, g, b = (int(value[i : i + 2], 16) for i in (1, 3, 5))
+    return (b, g, r)
+
+
+def _declarations(text):
+    return dict(
+        (name.strip(), value.strip())
+        for name, _, value in (item.partition(":") for item in text.split(";"))
+        if value
+    )
+
+
+class Plate:
+    """A parsed SVG ready to render at any width."""
+
+    def __init__(self, svg_text):
+        classes = {}
+        for style_text in _STYLE.findall(svg_text):
+            for selectors, body in _CSS_RULE.findall(style_text):
+                for selector in selectors.split(","):
+                    classes.setdefault(selector.strip().lstrip("."), {}).update(_declarations(body))
+        self.view_box = None
+        self.shapes = []
+        for tag, attr_text in _ELEMENT.findall(svg_text):
+            attrs = dict(_ATTR.findall(attr_text))
+            if tag == "svg":
+                if "viewBox" in attrs:
+                    self.view_box = [float(v) for v in attrs["viewBox"].replace(",", " ").split()]
+                else:
+                    self.view_box = [0.0, 0.0, float(attrs["width"]), float(attrs["height"])]
+            else:
+                style = {}
+                for name in attrs.get("class", "").split():
+                    style.update(classes.get(name, {}))
+                style.update({k: v for k, v in attrs.items() if k in ("fill", "opacity", "fill-opacity")})
+                style.update(_declarations(attrs.get("style", "")))
+                color = _parse_color(style.get("fill", "#000000"))
+                if color is None:  # fill="none" or an unsupported paint
+                    continue
+                opacity = float(style.get("opacity", 1)) * float(style.get("fill-opacity", 1))
+                polygons = flatten_path(attrs.get("d", ""))
+                if polygons and opacity > 0:
+                    self.shapes.append((color, opacity, polygons))
+        if self.view_box is None:
+            raise ValueError("Not an SVG document")
+
+    def size(self, width):
+        x, y, view_w, view_h = self.view_box
+        return width, max(1, round(view_h * width / view_w))
+
+    def render(self, width):
+        """BGR image of the plate scaled to width pixels."""
+        x, y, view_w, view_h = self.view_box
+        width, height = self.size(width)
+        scale = width / view_w * (1 << SHIFT)
+        offset = np.array([x, y])
+        canvas = np.full((height, width, 3), 255, np.uint8)
+        for color, opacity, polygons in self.shapes:
+            scaled = [np.rint((polygon - offset) * scale).astype(np.int32) for polygon in polygons]
+            if opacity >= 1:
+                cv2.fillPoly(canvas, scaled, color, cv2.LINE_AA, SHIFT)
+            else:
+                layer = canvas.copy()
+                cv2.fillPoly(layer, scaled, color, cv2.LINE_AA, SHIFT)
+                cv2.addWeighted(layer, opacity, canvas, 1 - opacity, 0, dst=canvas)
+        return canvas
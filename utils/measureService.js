@@ -0,0 +1,18 @@
+import axios from "axios";
+import http from "http";
+
+// Keep-alive connections to the Python measurement service
+const agent = new http.Agent({ keepAlive: true });
+
+// Request to process_server.py. With MEASURE_SOCKET set (co-located deployment)
+// it goes over that Unix socket instead of TCP to MEASURE_URL. Env is read per
+// call because dotenv is loaded after the modules are imported.
+export const measureServiceRequest = (path, config = {}) => {
+  const socketPath = process.env.MEASURE_SOCKET;
+  return axios({
+    url: socketPath ? `http://localhost/${path}` : `${process.env.MEASURE_URL}${path}`,
+    socketPath: socketPath || undefined,
+    httpAgent: agent,
+    ...config,
+  });
+};